@@ -0,0 +1,141 @@
+#  Copyright 2026 Nolan Stokely <nolan@stokely.org>
+"""
+What the speed of sound *should* be, from the air temperature.
+
+Sound goes faster in warm air (about 0.6 m/s faster for every degree C)
+and a tiny bit faster in damp air. So if we know the temperature we can
+guess the echo time before we measure it, and only look for the echo
+near there (echo_window_ms). That's quicker, and the echo finder can't be
+fooled by a bump somewhere else.
+
+The temperature can be typed in, or read from a sensor file:
+- a 1-Wire DS18B20 sensor: /sys/bus/w1/devices/28-*/w1_slave
+- an I2C sensor (BME280, SHT31, ...) with a Linux driver:
+  /sys/bus/iio/devices/iio:device*/in_temp_input (and in_humidityrelative_input)
+- a plain text file with the temperature in C, and optionally the humidity
+  in %, e.g. "21.5 40". Handy for testing without a sensor.
+"""
+import glob
+import os
+import time
+
+import numpy as np
+
+# Where to look for a sensor if none is given
+W1_GLOB = "/sys/bus/w1/devices/28-*/w1_slave"
+IIO_GLOB = "/sys/bus/iio/devices/iio:device*"
+
+
+def speed_of_sound(temp_c, humidity_pct=None):
+    """
+    Speed of sound in air (m/s). 331.3 m/s at 0 C, going up with the square
+    root of the absolute temperature, plus about 0.0124 m/s for every % of
+    humidity (None = dry air).
+    """
+    speed = 331.3 * np.sqrt(1.0 + temp_c / 273.15)
+    if humidity_pct is not None:
+        speed += 0.0124 * humidity_pct
+    return float(speed)
+
+
+def expected_echo_ms(distance_m, temp_c, humidity_pct=None):
+    """Round trip time (ms) there and back over distance_m."""
+    return 2.0 * distance_m / speed_of_sound(temp_c, humidity_pct) * 1000.0
+
+
+def echo_window_ms(distance_m, temp_c, humidity_pct=None, temp_error_c=3.0, margin_ms=1.0):
+    """
+    (earliest, latest) echo time to search, in ms: the expected echo time if
+    the temperature is off by up to temp_error_c either way (humidity
+    unknown means anywhere from dry to 100%), widened by margin_ms for the
+    time it takes the buzzer and microphone to react.
+    """
+    wet = 100.0 if humidity_pct is None else humidity_pct
+    dry = 0.0 if humidity_pct is None else humidity_pct
+    earliest = expected_echo_ms(distance_m, temp_c + temp_error_c, wet)
+    latest = expected_echo_ms(distance_m, temp_c - temp_error_c, dry)
+    return earliest - margin_ms, latest + margin_ms
+
+
+def _read(path):
+    with open(path) as f:
+        return f.read()
+
+
+def read_w1_slave(path):
+    """Temperature (C) from a 1-Wire w1_slave file, or None if the reading failed its check."""
+    lines = _read(path).splitlines()
+    if len(lines) < 2 or not lines[0].strip().endswith("YES") or "t=" not in lines[1]:
+        return None
+    return int(lines[1].split("t=")[1]) / 1000.0
+
+
+class AirSensor:
+    """
+    Reads (temp_c, humidity_pct) from a sensor file (see the top of this
+    file). path=None finds the first 1-Wire or I2C sensor there is.
+    humidity_pct is None if the sensor doesn't measure it.
+
+    read() reads it now. latest() is for reading it over and over: it only
+    reads it every every_s seconds (a 1-Wire reading takes most of a
+    second), tries `tries` times if a reading fails its check, and keeps
+    the last good reading if they all fail.
+    """
+
+    def __init__(self, path=None, every_s=0.0, tries=3):
+        if path is None:
+            path = find_sensor()
+            if path is None:
+                raise FileNotFoundError("no temperature sensor found")
+        self.path = path
+        self.every_s = every_s
+        self.tries = tries
+        self._reading = None
+        self._read_at = None
+
+    def latest(self):
+        """The last reading, read again if it's every_s old. Raises only if there never was a good one."""
+        now = time.monotonic()
+        if self._read_at is not None and now - self._read_at < self.every_s:
+            return self._reading
+        error = None
+        for _ in range(max(1, self.tries)):
+            try:
+                self._reading = self.read()
+                break
+            except (OSError, ValueError) as e:
+                error = e
+        else:
+            if self._reading is None:
+                raise error
+        # A failed try waits every_s too, so a broken sensor doesn't slow every shot
+        self._read_at = now
+        return self._reading
+
+    def read(self):
+        path = self.path
+        if os.path.isdir(path):
+            # Linux IIO driver: thousandths of a degree and of a %
+            temp_c = int(_read(os.path.join(path, "in_temp_input"))) / 1000.0
+            humidity_file = os.path.join(path, "in_humidityrelative_input")
+            humidity = int(_read(humidity_file)) / 1000.0 if os.path.exists(humidity_file) else None
+            return temp_c, humidity
+        if os.path.basename(path) == "w1_slave":
+            temp_c = read_w1_slave(path)
+            if temp_c is None:
+                raise ValueError(f"{path}: bad 1-Wire reading, try again")
+            return temp_c, None
+        fields = _read(path).split()
+        if not fields:
+            raise ValueError(f"{path} is empty")
+        return float(fields[0]), float(fields[1]) if len(fields) > 1 else None
+
+
+def find_sensor():
+    """Path of the first 1-Wire or I2C temperature sensor, or None."""
+    for path in sorted(glob.glob(W1_GLOB)):
+        return path
+    for path in sorted(glob.glob(IIO_GLOB)):
+        if os.path.exists(os.path.join(path, "in_temp_input")):
+            return path
+    return None
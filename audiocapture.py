@@ -0,0 +1,238 @@
+#  Copyright 2026 Nolan Stokely <nolan@stokely.org>
+"""
+Always-on microphone recording.
+
+Opening a new recording for every shot is slow and the start time wobbles.
+Instead we keep one microphone stream open the whole time and let it fill
+a ring buffer (a list that wraps around and overwrites the oldest sound).
+When we want a measurement we just copy out the piece we need.
+
+Opened with duplex=True, the same stream also plays sound (play()). Then
+what goes out and what comes in are counted on the sound card's own
+clock, so we know exactly which recorded sample the sound started at.
+"""
+import threading
+import time
+
+import numpy as np
+
+from backends import HardwareBackend
+
+
+class RingRecorder:
+    """
+    Keeps a microphone stream open and remembers the last `seconds` of sound.
+    The stream comes from `backend` (see backends.py; default is the real
+    sound card).
+
+    Positions are counted in samples since the stream started ("frames"),
+    so frame 48000 is one second in at 48 kHz. Only the audio callback
+    writes, and it moves `frames_written` forward *after* the samples are in
+    place, so readers never need a lock.
+    """
+
+    def __init__(self, sample_rate, seconds=2.0, device=None, blocksize=0, latency="low", backend=None,
+                 duplex=False):
+        self.sample_rate = int(sample_rate)
+        self.backend = backend
+        self.capacity = int(seconds * self.sample_rate)
+        self.device = device
+        self.blocksize = blocksize
+        self.latency = latency
+        self.buffer = np.zeros(self.capacity, dtype=np.float32)
+        self.frames_written = 0
+        self.overflows = 0
+        # (frame, perf_counter_ns) pair: "this sample was heard at this moment".
+        # Updated by the callback as one tuple so readers always see a matching pair.
+        self.clock_anchor = None
+        self._input_latency = 0.0
+        self._output_latency = 0.0
+        self._stream = None
+        # Playing (duplex only): play() leaves a request, the callback picks it up
+        self.duplex = duplex
+        self.can_play = False
+        self._play_request = None
+        self._playing = None
+
+    # -- stream control --
+
+    def start(self):
+        if self._stream is not None:
+            return self
+        backend = self.backend if self.backend is not None else HardwareBackend()
+        settings = dict(
+            samplerate=self.sample_rate,
+            channels=1,
+            dtype="float32",
+            device=self.device,
+            blocksize=self.blocksize,
+            latency=self.latency,
+        )
+        self.can_play = False
+        if self.duplex:
+            try:
+                self._stream = backend.duplex_stream(callback=self._duplex_callback, **settings)
+                self.can_play = True
+            except Exception:
+                # No output on this sound card: just record (play() won't work)
+                self._stream = None
+        if self._stream is None:
+            self._stream = backend.input_stream(callback=self._callback, **settings)
+        latency = self._stream.latency
+        if isinstance(latency, (tuple, list)):
+            self._input_latency, self._output_latency = float(latency[0]), float(latency[1])
+        else:
+            self._input_latency = float(latency)
+        self._stream.start()
+        return self
+
+    def close(self):
+        if self._stream is not None:
+            self._stream.stop()
+            self._stream.close()
+            self._stream = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _callback(self, indata, frames, time_info, status):
+        now_ns = time.perf_counter_ns()
+        if status.input_overflow:
+            self.overflows += 1
+        first = self.frames_written
+        self.write(indata[:, 0])
+
+        # PortAudio tells us (on its own clock) when the first sample of this
+        # block hit the ADC and what time it is now. The difference tells us
+        # how long ago, on our perf_counter clock, that sample was heard.
+        adc = time_info.inputBufferAdcTime
+        current = time_info.currentTime
+        if adc and current:
+            self.clock_anchor = (first, now_ns - int((current - adc) * 1e9))
+        else:
+            # Some sound cards report no times; guess from the stream latency.
+            self.clock_anchor = (first + frames, now_ns - int(self._input_latency * 1e9))
+
+    def _duplex_callback(self, indata, outdata, frames, time_info, status):
+        outdata.fill(0)
+        if self._playing is None and self._play_request is not None:
+            request = self._play_request
+            self._play_request = None
+            # Output sample 0 of this block leaves the speaker at the DAC
+            # time; line that up with the input frames on the same clock.
+            first = self.frames_written
+            adc = time_info.inputBufferAdcTime
+            dac = getattr(time_info, "outputBufferDacTime", 0)
+            if adc and dac:
+                request["frame"] = first + (dac - adc) * self.sample_rate
+            else:
+                request["frame"] = first + frames + (self._input_latency + self._output_latency) * self.sample_rate
+            self._playing = (request["wave"], 0)
+            request["done"].set()
+        if self._playing is not None:
+            wave, pos = self._playing
+            n = min(frames, len(wave) - pos)
+            outdata[:n, 0] = wave[pos:pos + n]
+            self._playing = (wave, pos + n) if pos + n < len(wave) else None
+        self._callback(indata, frames, time_info, status)
+
+    def play(self, wave, timeout=2.0):
+        """
+        Play wave through the sound card (needs duplex=True and an output).
+        Returns the frame (float) where its first sample comes out of the
+        speaker, on the recording's own sample count.
+        """
+        if not self.can_play:
+            raise RuntimeError("this recorder can't play sound (no duplex stream)")
+        request = {"wave": np.asarray(wave, dtype=np.float32).ravel(), "frame": None,
+                   "done": threading.Event()}
+        self._play_request = request
+        if not request["done"].wait(timeout):
+            self._play_request = None
+            raise TimeoutError("sound card stopped asking for sound to play")
+        return request["frame"]
+
+    def write(self, samples):
+        """Copy new samples into the ring (called from the audio thread)."""
+        total = self.frames_written + len(samples)
+        samples = samples[-self.capacity:]
+        n = len(samples)
+        start = (total - n) % self.capacity
+        first = min(n, self.capacity - start)
+        self.buffer[start:start + first] = samples[:first]
+        self.buffer[:n - first] = samples[first:]
+        self.frames_written = total
+
+    # -- reading --
+
+    def ms_to_frames(self, ms):
+        return int(round(ms / 1000.0 * self.sample_rate))
+
+    def frame_at(self, perf_ns, timeout=2.0):
+        """
+        Which sample (as a float, so in between samples is fine) was being
+        recorded at time.perf_counter_ns() == perf_ns.
+        """
+        deadline = time.monotonic() + timeout
+        while self.clock_anchor is None:
+            if time.monotonic() > deadline:
+                raise TimeoutError("microphone stream has not started")
+            time.sleep(0.001)
+        frame, anchor_ns = self.clock_anchor
+        return frame + (perf_ns - anchor_ns) * self.sample_rate / 1e9
+
+    def wait_for_frame(self, frame, timeout=2.0):
+        """Sleep until the stream has recorded up to `frame`."""
+        deadline = time.monotonic() + timeout
+        while self.frames_written < frame:
+            if time.monotonic() > deadline:
+                raise TimeoutError("microphone stream stopped delivering audio")
+            time.sleep(0.001)
+
+    def snapshot(self, start_frame, n):
+        """
+        Copy out n samples starting at start_frame.
+        The samples must already be recorded and not yet overwritten.
+        """
+        start_frame = int(start_frame)
+        n = int(n)
+        end_frame = start_frame + n
+        if end_frame > self.frames_written:
+            raise ValueError("asked for audio that has not been recorded yet")
+        if n > self.capacity:
+            raise ValueError("asked for more audio than the ring buffer holds")
+
+        out = np.empty(n, dtype=np.float32)
+        start = start_frame % self.capacity
+        first = min(n, self.capacity - start)
+        out[:first] = self.buffer[start:start + first]
+        out[first:] = self.buffer[:n - first]
+
+        # If the callback lapped us (before or while copying), the copy is junk.
+        if self.frames_written - start_frame > self.capacity:
+            raise RuntimeError("that audio was already overwritten; make the ring buffer bigger")
+        return out
+
+    def snapshot_around(self, trigger_frame, before_ms, after_ms, timeout=2.0):
+        """Wait for and return the sound from before_ms before to after_ms after trigger_frame."""
+        start = int(trigger_frame) - self.ms_to_frames(before_ms)
+        end = int(trigger_frame) + self.ms_to_frames(after_ms)
+        self.wait_for_frame(end, timeout)
+        return self.snapshot(start, end - start)
+
+    def snapshot_at_time(self, perf_ns, before_ms, after_ms, timeout=2.0):
+        """
+        Like snapshot_around, but the trigger is a time.perf_counter_ns() moment.
+        Returns (wave, index): index is where that moment lands in wave
+        (fractional, so it is sample-accurate).
+        """
+        return self.snapshot_at_frame(self.frame_at(perf_ns, timeout), before_ms, after_ms, timeout)
+
+    def snapshot_at_frame(self, frame, before_ms, after_ms, timeout=2.0):
+        """Like snapshot_at_time, for a (fractional) frame, e.g. from play()."""
+        trigger = int(np.floor(frame))
+        wave = self.snapshot_around(trigger, before_ms, after_ms, timeout)
+        return wave, frame - (trigger - self.ms_to_frames(before_ms))
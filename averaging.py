@@ -0,0 +1,142 @@
+#  Copyright 2026 Nolan Stokely <nolan@stokely.org>
+"""
+Coherent averaging: add up lots of shots to clean up a noisy echo.
+
+The echo is the same every shot, but the room noise is different, so if
+we line the shots up and average them the echo stays put while the noise
+shrinks. Averaging N shots makes the noise about sqrt(N) times quieter
+(4 shots: half, 100 shots: a tenth).
+
+Shots are lined up on the buzzer sound heard directly (or on the beep
+time) to a fraction of a sample, then added into running sums, so
+averaging 1000 shots takes no more memory than averaging 2.
+"""
+import numpy as np
+
+from echofinder import buzzer_filter, next_fast_len, refine_peak
+
+
+def shift_samples(wave, shift):
+    """
+    Move wave later by `shift` samples (can be fractional or negative),
+    using an FFT so nothing gets blurred. Sound moved in from outside the
+    recording is silence.
+    """
+    wave = np.asarray(wave, dtype=np.float64)
+    n = len(wave)
+    if shift == 0:
+        return wave.copy()
+    pad = int(np.ceil(abs(shift))) + 1
+    nfft = next_fast_len(n + 2 * pad)
+    spec = np.fft.rfft(wave, nfft)
+    spec *= np.exp(-2j * np.pi * np.fft.rfftfreq(nfft) * shift)
+    out = np.fft.irfft(spec, nfft)[:n]
+    # Whatever wrapped around from the end is junk, so blank it
+    if shift > 0:
+        out[:int(np.ceil(shift))] = 0.0
+    else:
+        out[n - int(np.ceil(-shift)):] = 0.0
+    return out
+
+
+class CoherentAverage:
+    """
+    Running average of equally long shots, lined up on align="direct"
+    (the buzzer heard directly: the biggest peak after matched filtering
+    with a pulse_ms tone at pulse_freq_hz, or with matched_filter) or
+    align="beep" (when the buzzer was switched on).
+
+    add() each shot, then use .mean() and .beep_index like a single shot.
+    .snr_db tracks how clean the average is after each shot.
+    """
+
+    def __init__(self, sample_rate, align="direct", pulse_ms=8, pulse_freq_hz=2700, matched_filter=None):
+        if align not in ("direct", "beep"):
+            raise ValueError(f"unknown align: {align!r}")
+        self.sample_rate = sample_rate
+        self.align = align
+        if matched_filter is None:
+            matched_filter = buzzer_filter(sample_rate, pulse_ms, pulse_freq_hz)
+        self.matched_filter = matched_filter
+        # The direct sound's peaks are one tone cycle apart and nearly as
+        # tall as each other; stay within half a cycle of where we expect it.
+        self.half_cycle = max(1, int(sample_rate / pulse_freq_hz / 2))
+        self.n = 0
+        self.sum = None
+        self.sum_sq = None
+        self.reference = None       # where shots get lined up to (sample index)
+        self._first_beep = None     # beep_index of the shot that set the reference
+        self._beep_sum = 0.0
+        self._beep_n = 0
+        self.skipped = 0            # shots we couldn't line up
+        self.snr_db = []            # (shots so far, SNR in dB)
+
+    def _origin(self, wave, beep_index):
+        if self.align == "direct":
+            # The direct sound is the loudest thing in the recording. Use its
+            # top (not lowest) peak so every shot lines up on the same wiggle.
+            score = self.matched_filter.correlate(wave)
+            lo, hi = 0, len(score)
+            if beep_index is not None and self._first_beep is not None:
+                expect = int(round(self.reference + beep_index - self._first_beep))
+                lo = max(0, expect - self.half_cycle)
+                hi = max(lo + 1, min(len(score), expect + self.half_cycle + 1))
+            return refine_peak(score, lo + int(np.argmax(score[lo:hi])))
+        return beep_index
+
+    def add(self, wave, beep_index=None):
+        """Line up and add one shot. Returns False if it couldn't be lined up."""
+        wave = np.asarray(wave, dtype=np.float64)
+        origin = self._origin(wave, beep_index)
+        if origin is None:
+            self.skipped += 1
+            return False
+        if self.sum is None:
+            self.sum = np.zeros(len(wave))
+            self.sum_sq = np.zeros(len(wave))
+            self.reference = origin
+            self._first_beep = beep_index
+        elif len(wave) != len(self.sum):
+            raise ValueError("all shots must be the same length")
+
+        shift = self.reference - origin
+        aligned = shift_samples(wave, shift)
+        self.sum += aligned
+        self.sum_sq += aligned * aligned
+        self.n += 1
+        if beep_index is not None:
+            self._beep_sum += beep_index + shift
+            self._beep_n += 1
+        if self.n > 1:
+            self.snr_db.append((self.n, self.snr()))
+        return True
+
+    def mean(self):
+        """The averaged shot."""
+        if self.n == 0:
+            raise ValueError("no shots added yet")
+        return self.sum / self.n
+
+    @property
+    def beep_index(self):
+        """Where the beep is in mean() (None if no shot had a beep time)."""
+        if self._beep_n == 0:
+            return None
+        return self._beep_sum / self._beep_n
+
+    def noise_power(self):
+        """How much noise is left in mean(), from how much the shots disagree."""
+        if self.n < 2:
+            return np.nan
+        mean = self.sum / self.n
+        var = (self.sum_sq - self.n * mean * mean) / (self.n - 1)
+        return float(np.mean(np.maximum(var, 0.0))) / self.n
+
+    def snr(self):
+        """Signal to noise ratio of mean(), in dB."""
+        noise = self.noise_power()
+        mean = self.sum / self.n
+        signal = float(np.mean(mean * mean)) - noise
+        if not noise > 0 or signal <= 0:
+            return np.nan
+        return 10.0 * np.log10(signal / noise)
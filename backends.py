@@ -0,0 +1,329 @@
+#  Copyright 2026 Nolan Stokely <nolan@stokely.org>
+"""
+Where the sound comes from: the real microphone and buzzer, or a pretend one.
+
+Everything that records or beeps asks a backend for its microphone stream
+and buzzer, so the same code runs on the Pi (HardwareBackend) or on any
+computer with no sound card or GPIO at all (SimulatedBackend). The pretend
+one makes up the sound of a buzzer in a tube, with echoes, a bit of
+bouncing around (multipath) and background noise.
+"""
+import threading
+import time
+import types
+
+import numpy as np
+
+from pulses import SoftwarePulser, make_pulser
+
+
+class HardwareBackend:
+    """The real thing: a sounddevice microphone and a gpiozero buzzer."""
+
+    name = "hardware"
+
+    def device_name(self, device=None):
+        """Name of microphone number `device` (None = the default one)."""
+        import sounddevice as sd
+        return sd.query_devices(device, "input")["name"]
+
+    def input_stream(self, **kwargs):
+        """Same arguments as sd.InputStream."""
+        import sounddevice as sd
+        return sd.InputStream(**kwargs)
+
+    def duplex_stream(self, **kwargs):
+        """Same arguments as sd.Stream: plays and records on one clock."""
+        import sounddevice as sd
+        return sd.Stream(**kwargs)
+
+    def buzzer(self, pin):
+        """Something with on(), off() and close(), like gpiozero's DigitalOutputDevice."""
+        from gpiozero import DigitalOutputDevice
+        return DigitalOutputDevice(pin)
+
+    def pulser(self, pin):
+        """Hardware-timed buzzer pulses if possible (see pulses.py)."""
+        return make_pulser(pin, fallback=lambda: self.buzzer(pin))
+
+    def play(self, wave, sample_rate, device=None):
+        """
+        Start playing wave on the sound card output (doesn't wait for it to
+        finish). Returns time.perf_counter_ns() when it should start coming
+        out of the speaker.
+        """
+        import sounddevice as sd
+        before = time.perf_counter_ns()
+        sd.play(wave, sample_rate, device=device)
+        return before + int(sd.get_stream().latency * 1e9)
+
+
+class Tube:
+    """
+    Pretend tube. A beep is a tone of freq_hz that fades in and out over
+    rise_ms. The microphone hears it directly (after direct_delay_ms), then
+    again every round trip down the tube, quieter each time. Each of those
+    arrivals also gets a few weaker copies a little later (multipath).
+    latency_ms is a fixed extra delay on everything, like a slow buzzer or
+    sound card.
+    """
+
+    def __init__(self, distance_m=3.0, speed_m_per_s=343.0, freq_hz=2700.0, rise_ms=0.5,
+                 direct_gain=1.0, direct_delay_ms=0.1, echo_gain=0.3, n_echoes=3,
+                 multipath=((0.35, 0.2), (1.1, 0.1)), noise=0.01, latency_ms=0.0):
+        self.distance_m = distance_m
+        self.speed_m_per_s = speed_m_per_s
+        self.freq_hz = freq_hz
+        self.rise_ms = rise_ms
+        self.direct_gain = direct_gain
+        self.direct_delay_ms = direct_delay_ms
+        self.echo_gain = echo_gain
+        self.n_echoes = n_echoes
+        self.multipath = multipath
+        self.noise = noise
+        self.latency_ms = latency_ms
+
+    def echo_delay_ms(self, order=1):
+        """True time for the order-th echo to come back, counted from the beep."""
+        return self.latency_ms + 1000.0 * 2.0 * order * self.distance_m / self.speed_m_per_s
+
+    def paths(self):
+        """List of (delay_s, gain) for every way the sound reaches the microphone."""
+        main = [(self.latency_ms + self.direct_delay_ms, self.direct_gain)]
+        for k in range(1, self.n_echoes + 1):
+            main.append((self.echo_delay_ms(k), self.direct_gain * self.echo_gain ** k))
+        out = []
+        for delay_ms, gain in main:
+            out.append((delay_ms / 1000.0, gain))
+            for extra_ms, extra_gain in self.multipath:
+                out.append(((delay_ms + extra_ms) / 1000.0, gain * extra_gain))
+        return out
+
+    def _pulse(self, tau, length_s):
+        # The buzzer sound, tau seconds after it switched on (0 outside the beep)
+        rise = max(self.rise_ms / 1000.0, 1e-9)
+        env = np.clip(np.minimum(tau, length_s - tau) / rise, 0.0, 1.0)
+        return np.sin(2.0 * np.pi * self.freq_hz * tau) * env
+
+    def render(self, t, beeps, rng=None, sounds=()):
+        """
+        Sound at times t (seconds, numpy array) for beeps given as a list of
+        (start_s, length_s) on the same clock. Exact at any fractional time.
+        sounds are things played through a speaker at the same spot as the
+        buzzer, as (start_s, wave, sample_rate).
+        """
+        out = np.zeros(len(t))
+        for start_s, length_s in beeps:
+            for delay_s, gain in self.paths():
+                tau = t - (start_s + delay_s)
+                inside = (tau >= 0.0) & (tau < length_s)
+                if inside.any():
+                    out[inside] += gain * self._pulse(tau[inside], length_s)
+        for start_s, wave, sample_rate in sounds:
+            wave_t = np.arange(len(wave)) / float(sample_rate)
+            for delay_s, gain in self.paths():
+                out += gain * np.interp(t - (start_s + delay_s), wave_t, wave, left=0.0, right=0.0)
+        if rng is not None and self.noise > 0:
+            out += rng.normal(0.0, self.noise, len(t))
+        return out
+
+    def longest_delay_s(self):
+        return max(delay for delay, _ in self.paths())
+
+
+class SimBuzzer:
+    """Pretend buzzer: remembers when it was switched on and off."""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.is_active = False
+
+    def on(self):
+        if not self.is_active:
+            self.is_active = True
+            self.backend.beep_started(time.perf_counter_ns())
+
+    def off(self):
+        if self.is_active:
+            self.is_active = False
+            self.backend.beep_stopped(time.perf_counter_ns())
+
+    def close(self):
+        self.off()
+
+
+class SimInputStream:
+    """
+    Pretend microphone with the same parts of the sd.InputStream API that
+    RingRecorder uses. A thread calls the callback with blocks of made-up
+    sound at the real sample rate, with PortAudio-style timestamps.
+
+    With duplex=True it is a pretend sd.Stream instead: the callback also
+    fills an output block, which comes out of a pretend speaker one block
+    after the callback.
+    """
+
+    def __init__(self, backend, samplerate, callback, blocksize=0, latency=None, duplex=False, **ignored):
+        self.backend = backend
+        self.samplerate = int(samplerate)
+        self.callback = callback
+        self.blocksize = int(blocksize) or 256
+        self.duplex = duplex
+        self.latency = self.blocksize / self.samplerate
+        if duplex:
+            self.latency = (self.latency, self.latency)
+        self._running = False
+        self._thread = None
+        self._t0_ns = None
+
+    def start(self):
+        self._t0_ns = time.perf_counter_ns()
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def close(self):
+        self.stop()
+
+    def _run(self):
+        sr = self.samplerate
+        n = self.blocksize
+        status = types.SimpleNamespace(input_overflow=False)
+        frame = 0
+        while self._running:
+            # Wait until this block would really have been recorded
+            ready_ns = self._t0_ns + int((frame + n) * 1e9 / sr)
+            while time.perf_counter_ns() < ready_ns:
+                time.sleep(min(0.001, (ready_ns - time.perf_counter_ns()) / 1e9 + 1e-5))
+
+            t = (frame + np.arange(n)) / sr
+            beeps = self.backend.beeps_since(self._t0_ns, t[0])
+            sounds = self.backend.sounds_since(self._t0_ns, t[0])
+            block = self.backend.tube.render(t, beeps, self.backend.rng, sounds).astype(np.float32)
+            # Like PortAudio, the stream clock is a system clock in seconds
+            time_info = types.SimpleNamespace(
+                inputBufferAdcTime=self._t0_ns / 1e9 + frame / sr,
+                currentTime=time.perf_counter_ns() / 1e9,
+            )
+            if not self.duplex:
+                self.callback(block[:, None], n, time_info, status)
+            else:
+                out_frame = frame + 2 * n       # written now, heard after one more block
+                time_info.outputBufferDacTime = self._t0_ns / 1e9 + out_frame / sr
+                outdata = np.zeros((n, 1), dtype=np.float32)
+                self.callback(block[:, None], outdata, n, time_info, status)
+                if outdata.any():
+                    self.backend.add_sound(self._t0_ns + int(out_frame * 1e9 / sr), outdata[:, 0], sr)
+            frame += n
+
+
+class SimulatedBackend:
+    """
+    Pretend microphone, buzzer and speaker for running without the Pi. Use
+    it live (input_stream + buzzer or play, in real time) or make whole
+    recordings straight away with record_shots(), which is as fast as the
+    computer can go.
+    """
+
+    name = "simulated"
+
+    def __init__(self, tube=None, seed=None):
+        self.tube = tube if tube is not None else Tube()
+        self.rng = np.random.default_rng(seed)
+        self._lock = threading.Lock()
+        self._beeps = []     # [on_ns, off_ns or None]
+        self._sounds = []    # (start_ns, wave, sample_rate)
+
+    def device_name(self, device=None):
+        return "simulated"
+
+    def input_stream(self, samplerate, callback, **kwargs):
+        return SimInputStream(self, samplerate, callback, **kwargs)
+
+    def duplex_stream(self, samplerate, callback, **kwargs):
+        return SimInputStream(self, samplerate, callback, duplex=True, **kwargs)
+
+    def buzzer(self, pin):
+        return SimBuzzer(self)
+
+    def pulser(self, pin):
+        return SoftwarePulser(SimBuzzer(self))
+
+    def play(self, wave, sample_rate, device=None):
+        """Pretend speaker next to the buzzer. Returns time.perf_counter_ns() at the start."""
+        now = time.perf_counter_ns()
+        self.add_sound(now, wave, sample_rate)
+        return now
+
+    def add_sound(self, start_ns, wave, sample_rate):
+        """The pretend speaker plays wave from time.perf_counter_ns() == start_ns."""
+        wave = np.asarray(wave, dtype=np.float64).ravel()
+        forget_ns = start_ns - int((self.tube.longest_delay_s() + 1.0) * 1e9)
+        with self._lock:
+            self._sounds = [s for s in self._sounds if s[0] + int(len(s[1]) / s[2] * 1e9) > forget_ns]
+            if self._sounds:
+                # A duplex stream plays in blocks: glue a block onto the one before it
+                last_ns, last_wave, last_rate = self._sounds[-1]
+                end_ns = last_ns + int(len(last_wave) * 1e9 / last_rate)
+                if last_rate == sample_rate and abs(start_ns - end_ns) < 1000:
+                    self._sounds[-1] = (last_ns, np.concatenate((last_wave, wave)), sample_rate)
+                    return
+            self._sounds.append((start_ns, wave, sample_rate))
+
+    def beep_started(self, perf_ns):
+        # Forget beeps that finished long enough ago that nothing can hear them
+        forget_ns = perf_ns - int((self.tube.longest_delay_s() + 1.0) * 1e9)
+        with self._lock:
+            self._beeps = [b for b in self._beeps if b[1] is None or b[1] > forget_ns]
+            self._beeps.append([perf_ns, None])
+
+    def beep_stopped(self, perf_ns):
+        with self._lock:
+            if self._beeps and self._beeps[-1][1] is None:
+                self._beeps[-1][1] = perf_ns
+
+    def beeps_since(self, t0_ns, t_s):
+        """
+        Beeps that can still be heard at t_s seconds on a stream that started
+        at perf_counter_ns() == t0_ns, as (start_s, length_s) on that clock.
+        """
+        keep_s = self.tube.longest_delay_s()
+        out = []
+        with self._lock:
+            for on_ns, off_ns in self._beeps:
+                start_s = (on_ns - t0_ns) / 1e9
+                length_s = np.inf if off_ns is None else (off_ns - on_ns) / 1e9
+                if start_s + length_s + keep_s >= t_s:
+                    out.append((start_s, length_s))
+        return out
+
+    def sounds_since(self, t0_ns, t_s):
+        """Like beeps_since, for play(): (start_s, wave, sample_rate) still heard at t_s."""
+        keep_s = self.tube.longest_delay_s()
+        out = []
+        with self._lock:
+            for start_ns, wave, sample_rate in self._sounds:
+                start_s = (start_ns - t0_ns) / 1e9
+                if start_s + len(wave) / sample_rate + keep_s >= t_s:
+                    out.append((start_s, wave, sample_rate))
+        return out
+
+    def record_shots(self, n_shots, sample_rate, n_samples, beep_index, beep_ms, jitter=1.0):
+        """
+        Make n_shots recordings of one beep each, shape (n_shots, n_samples).
+        The beep starts at beep_index plus a random 0..jitter samples.
+        Returns (waves, beep_indexes).
+        """
+        waves = np.empty((n_shots, n_samples), dtype=np.float32)
+        beep_indexes = beep_index + self.rng.uniform(0.0, jitter, n_shots)
+        t = np.arange(n_samples) / float(sample_rate)
+        for k in range(n_shots):
+            beeps = [(beep_indexes[k] / sample_rate, beep_ms / 1000.0)]
+            waves[k] = self.tube.render(t, beeps, self.rng)
+        return waves, list(beep_indexes)
@@ -0,0 +1,237 @@
+#!/home/murray/env/bin/python3
+#  Copyright 2026 Nolan Stokely <nolan@stokely.org>
+"""
+Benchmarks for the echo pipeline, on made-up recordings (no Pi needed).
+
+For every sample rate and recording length in the grid it measures:
+- detector latency: one shot through echo_times_ms (what find_echo_time_ms does),
+  with the same settings as scifair.py and scifairgui.py
+- speed: compute_speed for one echo time
+- batch throughput: shots per second through echo_times_ms, many at once
+- memory per shot: peak extra memory during a batch, divided by shots
+- plot refresh: one WavePlot.show() on an off-screen (Agg) canvas
+- with --parallel, parallel throughput: shots per second through a
+  ParallelDetector using every core
+
+Results are saved as JSON in benchmarks/<computer>/<version>.json so you can
+compare versions later:
+
+    python benchmark.py --save
+    python benchmark.py --compare benchmarks/pi/abc123.json benchmarks/pi/def456.json
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from backends import SimulatedBackend, Tube
+from echofinder import echo_times_ms, speed_m_per_s
+from excitation import make_excitation
+from parallel import ParallelDetector
+
+SAMPLE_RATES = [16000, 44100, 48000, 96000]
+WINDOW_MS = [40, 100, 500]
+BATCH_SHOTS = 64
+PARALLEL_SHOTS = 1024       # --parallel: shots per batch for ParallelDetector
+PRE_BEEP_MS = 2
+BEEP_MS = 8
+# The echo finder settings scifair.py and scifairgui.py use by default
+ENVELOPE = "hilbert"
+CFAR_DB = None
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks")
+
+
+def best_time(fn, repeat=7, number=None, min_time=0.05):
+    """
+    Seconds per call of fn(), like timeit: run it `number` times in a loop
+    (picked so one loop takes at least min_time), repeat, keep the fastest.
+    """
+    if number is None:
+        number = 1
+        while True:
+            t = time.perf_counter()
+            for _ in range(number):
+                fn()
+            if time.perf_counter() - t >= min_time:
+                break
+            number *= 2
+    best = float("inf")
+    for _ in range(repeat):
+        t = time.perf_counter()
+        for _ in range(number):
+            fn()
+        best = min(best, (time.perf_counter() - t) / number)
+    return best
+
+
+def peak_memory(fn):
+    """Most extra memory (bytes) used while fn() runs."""
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def make_shots(n_shots, sample_rate, window_ms):
+    sim = SimulatedBackend(Tube(), seed=0)
+    n = int((PRE_BEEP_MS + window_ms) / 1000.0 * sample_rate)
+    beep_index = PRE_BEEP_MS / 1000.0 * sample_rate
+    return sim.record_shots(n_shots, sample_rate, n, beep_index, BEEP_MS)
+
+
+def make_plot():
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from wavedisplay import WavePlot
+    return WavePlot(FigureCanvasAgg(Figure(figsize=(6, 4), dpi=100)))
+
+
+def bench_case(sample_rate, window_ms, plot=True, quick=False, parallel=False):
+    waves, beep_indexes = make_shots(BATCH_SHOTS, sample_rate, window_ms)
+    one, one_beep = waves[:1], beep_indexes[:1]
+    repeat = 3 if quick else 7
+
+    excitation = make_excitation("beep", beep_ms=BEEP_MS)
+    settings = dict(pulse_ms=excitation.blank_ms, matched_filter=excitation.matched_filter(sample_rate),
+                    envelope=ENVELOPE, cfar_margin_db=CFAR_DB, search_end_ms=window_ms)
+
+    def detect_one():
+        return echo_times_ms(one, sample_rate, one_beep, **settings)
+
+    def detect_batch():
+        return echo_times_ms(waves, sample_rate, beep_indexes, **settings)
+
+    echo_ms = float(detect_one()[0])
+    result = {
+        "sample_rate": sample_rate,
+        "window_ms": window_ms,
+        "samples_per_shot": waves.shape[1],
+        "detect_ms": 1000.0 * best_time(detect_one, repeat),
+        "speed_us": 1e6 * best_time(lambda: speed_m_per_s(echo_ms, 3.0), repeat),
+        "batch_shots_per_s": BATCH_SHOTS / best_time(detect_batch, repeat, number=1),
+        "shot_bytes": waves[0].nbytes,
+        "memory_per_shot_bytes": peak_memory(detect_batch) / BATCH_SHOTS,
+    }
+
+    if plot:
+        wp = make_plot()
+        x_ms = (np.arange(waves.shape[1]) - beep_indexes[0]) / sample_rate * 1000.0
+        wp.show(x_ms, waves[0], echo_ms)     # first one is a full draw
+        k = [0]
+
+        def refresh():
+            k[0] = (k[0] + 1) % BATCH_SHOTS
+            wp.show(x_ms, waves[k[0]], echo_ms)
+
+        result["plot_refresh_ms"] = 1000.0 * best_time(refresh, repeat)
+
+    if parallel:
+        many = np.tile(waves, (PARALLEL_SHOTS // BATCH_SHOTS, 1))
+        many_beeps = list(beep_indexes) * (PARALLEL_SHOTS // BATCH_SHOTS)
+        with ParallelDetector(sample_rate, 3.0, **settings) as detector:
+            detector.detect(many, many_beeps)     # start the workers
+            seconds = best_time(lambda: detector.detect(many, many_beeps), repeat, number=1)
+        result["parallel_shots_per_s"] = len(many) / seconds
+    return result
+
+
+def version():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__)))
+        return out.stdout.strip() or "unknown"
+    except OSError:
+        return "unknown"
+
+
+def run(sample_rates, windows, plot=True, quick=False, parallel=False):
+    cases = []
+    for sr in sample_rates:
+        for window_ms in windows:
+            case = bench_case(sr, window_ms, plot, quick, parallel)
+            cases.append(case)
+            print(
+                f"{sr:6d} Hz {window_ms:4d} ms: detect {case['detect_ms']:7.3f} ms, "
+                f"batch {case['batch_shots_per_s']:8.1f} shots/s, "
+                f"mem {case['memory_per_shot_bytes'] / 1024:7.1f} KiB/shot"
+                + (f", plot {case['plot_refresh_ms']:6.2f} ms" if "plot_refresh_ms" in case else "")
+                + (f", parallel {case['parallel_shots_per_s']:8.1f} shots/s" if "parallel_shots_per_s" in case else ""),
+                flush=True,
+            )
+    return {
+        "version": version(),
+        "time": time.time(),
+        "machine": platform.node(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "cases": cases,
+    }
+
+
+def save(results):
+    folder = os.path.join(RESULTS_DIR, results["machine"] or "unknown")
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, results["version"] + ".json")
+    with open(path, "w") as f:
+        json.dump(results, f, indent=1)
+    return path
+
+
+# For these, smaller is better; for the rest (throughput), bigger is better.
+LOWER_IS_BETTER = {"detect_ms", "speed_us", "memory_per_shot_bytes", "plot_refresh_ms"}
+
+
+def compare(old_path, new_path, threshold=1.1):
+    """Print new/old for every number; flag anything that got worse by more than threshold."""
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    old_cases = {(c["sample_rate"], c["window_ms"]): c for c in old["cases"]}
+    worse = 0
+    print(f"{old['version']} -> {new['version']}")
+    for case in new["cases"]:
+        key = (case["sample_rate"], case["window_ms"])
+        if key not in old_cases:
+            continue
+        for name in sorted(LOWER_IS_BETTER | {"batch_shots_per_s", "parallel_shots_per_s"}):
+            if name not in case or name not in old_cases[key] or not old_cases[key][name]:
+                continue
+            ratio = case[name] / old_cases[key][name]
+            slower = ratio if name in LOWER_IS_BETTER else 1.0 / ratio
+            flag = "  WORSE" if slower > threshold else ""
+            worse += bool(flag)
+            print(f"{key[0]:6d} Hz {key[1]:4d} ms {name:22s} x{ratio:6.2f}{flag}")
+    return worse
+
+
+def main(args):
+    parser = argparse.ArgumentParser(description="Benchmark the echo pipeline on made-up recordings.")
+    parser.add_argument("--rates", type=int, nargs="+", default=SAMPLE_RATES, help="sample rates to try")
+    parser.add_argument("--windows", type=int, nargs="+", default=WINDOW_MS, help="recording lengths (ms) to try")
+    parser.add_argument("--no-plot", action="store_true", help="skip the plot benchmark (no matplotlib needed)")
+    parser.add_argument("--quick", action="store_true", help="fewer repeats")
+    parser.add_argument("--parallel", action="store_true", help="also time ParallelDetector on every core")
+    parser.add_argument("--save", action="store_true", help="save results under benchmarks/")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="compare two saved results")
+    opts = parser.parse_args(args)
+
+    if opts.compare:
+        return 1 if compare(*opts.compare) else 0
+
+    results = run(opts.rates, opts.windows, plot=not opts.no_plot, quick=opts.quick, parallel=opts.parallel)
+    if opts.save:
+        print("saved", save(results))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,238 @@
+#!/home/murray/env/bin/python3
+#  Copyright 2026 Nolan Stokely <nolan@stokely.org>
+"""
+Measure the computer's own delay once, so every shot can take it off.
+
+The echo time we measure is a little too long: the buzzer takes a moment
+to get loud, and the sound card and USB hold on to the sound for a bit
+before we see it. That extra time (the "offset") is the same every shot,
+so it makes every speed a bit too slow, and averaging more shots doesn't
+fix it. Calibrating measures it, in one of three ways:
+
+    python calibration.py loopback          # microphone right next to the buzzer
+    python calibration.py short --distance 2 --temp 21
+                                            # a tube of known length, air of known temperature
+    python calibration.py two --distances 2 3
+                                            # two tubes: no temperature needed
+
+"two" fits a straight line, echo time = offset + distance * (2 / speed),
+through the shots from both tubes, so it finds the offset and the speed.
+(The tubes must be long enough for the echo to come back after the beep
+is over, about 2 m for an 8 ms beep.)
+
+The offset is saved in calibration.json, under the name of the microphone,
+and scifair.py and scifairgui.py take it off every echo time from then on,
+as long as they beep the same way: the buzzer and the speaker (--speaker),
+and a beep and a buzzer code (--excitation), each take their own time to
+get loud, so a profile only counts for the one it was measured with.
+
+The defaults are scifair.py's sound card and buzzer pin. For the GUI, give
+its settings, e.g. --rate 48000 --device default --pin 18.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+from echofinder import refine_peak
+
+PROFILE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "calibration.json")
+
+
+def device_key(backend, device=None):
+    """What to file a microphone's calibration under: its name, or its number if it has none."""
+    try:
+        return backend.device_name(device)
+    except Exception:
+        return "default" if device is None else f"device {device}"
+
+
+def load_profile(key, path=PROFILE_FILE):
+    """The saved calibration for this microphone (a dict with "offset_ms"), or None."""
+    try:
+        with open(path) as f:
+            return json.load(f).get(key)
+    except (OSError, ValueError):
+        return None
+
+
+def save_profile(key, profile, path=PROFILE_FILE):
+    """Save (or replace) the calibration for this microphone, keeping the others."""
+    try:
+        with open(path) as f:
+            profiles = json.load(f)
+    except (OSError, ValueError):
+        profiles = {}
+    profiles[key] = profile
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(profiles, f, indent=1)
+    os.replace(tmp, path)
+
+
+def direct_delay_ms(waves, beep_indexes, sample_rate, matched_filter):
+    """
+    Loopback: how long after each beep the microphone hears it, when the
+    microphone is right next to the buzzer. That's all offset.
+    """
+    delays = []
+    for wave, beep_index in zip(waves, beep_indexes):
+        loud = matched_filter.envelope(wave)
+        p = int(np.argmax(loud))
+        delays.append((refine_peak(loud, p) - beep_index) / sample_rate * 1000.0)
+    return np.array(delays)
+
+
+def offset_from_known_speed(echo_ms, distance_m, speed_m_per_s):
+    """Short tube: measured echo time minus what it should have been."""
+    echo_ms = np.asarray(echo_ms, dtype=np.float64)
+    echo_ms = echo_ms[np.isfinite(echo_ms)]
+    return float(np.median(echo_ms)) - 2.0 * distance_m / speed_m_per_s * 1000.0
+
+
+def fit_two_distances(distances_m, echo_ms):
+    """
+    Straight line through (distance, echo time) for every shot, where
+    echo_ms[i] holds the shots at distances_m[i]. Returns a dict with the
+    offset_ms (where the line crosses distance 0), the speed_m_per_s (from
+    its slope) and offset_err_ms (how sure we are of the offset).
+    """
+    d = np.concatenate([np.full(len(t), dist) for dist, t in zip(distances_m, echo_ms)])
+    t = np.concatenate([np.asarray(t, dtype=np.float64) for t in echo_ms])
+    good = np.isfinite(t)
+    d, t = d[good], t[good]
+    if len(np.unique(d)) < 2:
+        raise ValueError("need echoes from two different distances")
+    A = np.column_stack([np.ones_like(d), d])
+    (offset, slope), *_ = np.linalg.lstsq(A, t, rcond=None)
+    residual = t - A @ np.array([offset, slope])
+    dof = max(1, len(t) - 2)
+    cov = np.linalg.inv(A.T @ A) * float(residual @ residual) / dof
+    return {
+        "offset_ms": float(offset),
+        "speed_m_per_s": 2000.0 / float(slope),
+        "offset_err_ms": float(np.sqrt(cov[0, 0])),
+    }
+
+
+def matches(profile, beep_from, excitation):
+    """
+    True if the profile was measured beeping the same way: beep_from
+    "buzzer" or "speaker", and the same excitation name. (Profiles saved
+    before beep_from was kept were all measured with the buzzer.)
+    """
+    return (profile.get("beep_from", "buzzer") == beep_from
+            and profile.get("excitation", "beep") == excitation)
+
+
+def _device(text):
+    """--device: a number, a name, or "default"."""
+    if text == "default":
+        return None
+    return int(text) if text.isdigit() else text
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(description="Measure the fixed delay of the buzzer and microphone.")
+    parser.add_argument("method", choices=["loopback", "short", "two"])
+    parser.add_argument("--shots", type=int, default=30, help="shots per setup (default %(default)s)")
+    parser.add_argument("--distance", type=float, help="short: one-way tube length (m)")
+    parser.add_argument("--distances", type=float, nargs=2, help="two: the two tube lengths (m)")
+    parser.add_argument("--temp", type=float, help="short: air temperature (C)")
+    parser.add_argument("--speed", type=float, default=343.0, help="short: speed of sound if --temp isn't given")
+    parser.add_argument("--excitation", default="beep", help="what to send (see scifair.py)")
+    parser.add_argument("--speaker", action="store_true",
+                        help="play the sound through the sound card instead of the buzzer (like scifair.py --speaker)")
+    parser.add_argument("--rate", type=int, help="sample rate (default: scifair.py's; the GUI uses 48000)")
+    parser.add_argument("--device",
+                        help="sound card number or name, or \"default\" (default: scifair.py's; the GUI uses default)")
+    parser.add_argument("--pin", type=int, help="buzzer GPIO pin (default: scifair.py's; the GUI uses 18)")
+    parser.add_argument("--simulate", action="store_true", help="pretend microphone and tube (no Pi needed)")
+    parser.add_argument("--profile", default=PROFILE_FILE, help="where to save it (default %(default)s)")
+    opts = parser.parse_args(args)
+    if opts.method == "short" and opts.distance is None:
+        parser.error("short needs --distance")
+    if opts.method == "two" and opts.distances is None:
+        parser.error("two needs --distances")
+    return opts
+
+
+def main(args):
+    # The measuring parts of scifair.py, loaded here so importing this file stays quick
+    from airspeed import speed_of_sound
+    from audiocapture import RingRecorder
+    from backends import HardwareBackend, SimulatedBackend, Tube
+    from echofinder import echo_times_ms
+    from excitation import make_excitation
+    import scifair
+
+    opts = parse_args(args)
+    excitation = make_excitation(opts.excitation, beep_ms=scifair.BEEP_MS, freq_hz=scifair.BUZZER_FREQ_HZ)
+    sr = opts.rate or scifair.SAMPLE_RATE
+    device = scifair.DEVICE if opts.device is None else _device(opts.device)
+    mf = excitation.matched_filter(sr)
+    if opts.simulate:
+        backend = SimulatedBackend(Tube(distance_m=opts.distance or 3.0))
+    else:
+        backend = HardwareBackend()
+    recorder = RingRecorder(sr, device=device, backend=backend, duplex=opts.speaker).start()
+    if opts.speaker and not recorder.can_play:
+        print("no sound card output, using the buzzer", file=sys.stderr)
+    buzzer = backend.pulser(scifair.BUZZER_PIN if opts.pin is None else opts.pin)
+
+    def shots(distance_m=None):
+        if distance_m is not None:
+            if opts.simulate:
+                backend.tube.distance_m = distance_m
+            else:
+                input(f"Set up the {distance_m} m tube, then press Enter ")
+        waves, beeps = [], []
+        for k in range(opts.shots):
+            if k > 0:
+                time.sleep(scifair.BEEP_GAP_S)
+            wave, beep_index = scifair.take_shot(recorder, buzzer, excitation, backend)
+            waves.append(wave)
+            beeps.append(beep_index)
+        return np.array(waves), beeps
+
+    def echoes(waves, beeps):
+        # No CFAR: in a short tube the echo comes right after the beep, and
+        # the beep would drown out the noise level around it
+        return echo_times_ms(waves, sr, beeps, pulse_ms=excitation.blank_ms, matched_filter=mf,
+                             search_end_ms=None, envelope="hilbert")
+
+    try:
+        if opts.method == "loopback":
+            delays = direct_delay_ms(*shots(), sr, mf)
+            profile = {"offset_ms": float(np.median(delays)),
+                       "offset_err_ms": float(np.std(delays) / np.sqrt(len(delays)))}
+        elif opts.method == "short":
+            speed = opts.speed if opts.temp is None else speed_of_sound(opts.temp)
+            echo_ms = echoes(*shots(opts.distance))
+            profile = {"offset_ms": offset_from_known_speed(echo_ms, opts.distance, speed),
+                       "offset_err_ms": float(np.nanstd(echo_ms) / np.sqrt(np.isfinite(echo_ms).sum())),
+                       "distance_m": opts.distance, "speed_m_per_s": speed}
+        else:
+            echo_ms = [echoes(*shots(d)) for d in opts.distances]
+            profile = fit_two_distances(opts.distances, echo_ms)
+            profile["distances_m"] = list(opts.distances)
+    finally:
+        buzzer.close()
+        recorder.close()
+
+    key = device_key(backend, device)
+    profile.update(method=opts.method, excitation=opts.excitation,
+                   beep_from="speaker" if recorder.can_play else "buzzer",
+                   sample_rate=sr, shots=opts.shots, time=time.time())
+    save_profile(key, profile, opts.profile)
+    print(f"{key}: offset {profile['offset_ms']:.3f} ± {profile['offset_err_ms']:.3f} ms"
+          + (f", speed {profile['speed_m_per_s']:.1f} m/s" if opts.method == "two" else ""))
+    print(f"saved in {opts.profile}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
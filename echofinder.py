@@ -0,0 +1,534 @@
+#  Copyright 2026 Nolan Stokely <nolan@stokely.org>
+"""
+Echo finding helpers for the speed-of-sound experiment.
+
+The main trick here is a "matched filter": we slide a copy of what the
+buzzer sounds like (the template) along the recording and see where it
+lines up best. Doing that with FFTs keeps it fast even for long recordings.
+"""
+import numpy as np
+
+
+def next_fast_len(n):
+    """Smallest number >= n made only of 2s, 3s and 5s (FFTs love those)."""
+    n = max(1, int(n))
+    best = 1 << (n - 1).bit_length()
+    p5 = 1
+    while p5 < best:
+        p35 = p5
+        while p35 < best:
+            p235 = p35
+            while p235 < n:
+                p235 *= 2
+            best = min(best, p235)
+            p35 *= 3
+        p5 *= 5
+    return best
+
+
+def make_buzzer_template(sample_rate, on_ms, freq_hz):
+    """
+    Make a fake buzzer pulse: a tone of freq_hz that lasts on_ms,
+    faded in and out so it looks like a real buzzer starting and stopping.
+    """
+    n = max(1, int(round(on_ms / 1000.0 * sample_rate)))
+    t = np.arange(n) / float(sample_rate)
+    return np.sin(2.0 * np.pi * freq_hz * t) * np.hanning(n)
+
+
+class MatchedFilter:
+    """
+    Cross-correlates recordings against one fixed template.
+
+    The FFT of the template only depends on the FFT size, so it is worked
+    out once per size and reused for every later recording.
+    """
+
+    def __init__(self, template):
+        template = np.asarray(template, dtype=np.float64).ravel()
+        if len(template) == 0:
+            raise ValueError("template is empty")
+        template = template - template.mean()
+        energy = np.sqrt(np.sum(template * template))
+        if energy > 0:
+            template = template / energy
+        self.template = template
+        self._spectra = {}
+
+    def spectrum(self, nfft):
+        """Conjugated template spectrum for an FFT of size nfft (cached)."""
+        spec = self._spectra.get(nfft)
+        if spec is None:
+            spec = np.conj(np.fft.rfft(self.template, nfft))
+            self._spectra[nfft] = spec
+        return spec
+
+    def correlate(self, wave):
+        """
+        Return score[k] = how well the template matches the recording when it
+        starts at sample k. Same length as the recording.
+        Works on one recording (1D) or many recordings at once (2D, one per row).
+        """
+        wave = np.asarray(wave, dtype=np.float64)
+        n = wave.shape[-1]
+        nfft = next_fast_len(n + len(self.template) - 1)
+        spec = np.fft.rfft(wave, nfft, axis=-1) * self.spectrum(nfft)
+        return np.fft.irfft(spec, nfft, axis=-1)[..., :n]
+
+    def envelope(self, wave):
+        """
+        Smooth outline of correlate(wave) (see hilbert_envelope), worked out
+        from the same FFT, so it costs about the same as correlate().
+        """
+        wave = np.asarray(wave, dtype=np.float64)
+        n = wave.shape[-1]
+        nfft = next_fast_len(n + len(self.template) - 1)
+        spec = np.fft.rfft(wave, nfft, axis=-1) * self.spectrum(nfft)
+        return _envelope_from_rfft(spec, nfft, n)
+
+    def deconvolve(self, wave, noise=0.01):
+        """
+        Estimate the impulse response h of the tube: the recording is about
+        the template played through h, so h[k] is how much sound arrives k
+        samples after the template starts (direct sound, each echo, ...).
+        Dividing spectra blows up where the template has almost no sound,
+        so `noise` (a fraction of the template's loudest frequency) keeps
+        that in check (a "Wiener" deconvolution). Same length as wave.
+        """
+        wave = np.asarray(wave, dtype=np.float64)
+        n = wave.shape[-1]
+        nfft = next_fast_len(n + len(self.template) - 1)
+        conj = self.spectrum(nfft)
+        power = (conj * np.conj(conj)).real
+        spec = np.fft.rfft(wave, nfft, axis=-1) * conj / (power + noise * power.max())
+        return np.fft.irfft(spec, nfft, axis=-1)[..., :n]
+
+
+_ANALYTIC_WEIGHTS = {}
+
+
+def _envelope_from_rfft(spec, nfft, n):
+    # Keep only the positive frequencies (doubled): the inverse FFT is then
+    # the "analytic signal", whose size is the envelope.
+    weights = _ANALYTIC_WEIGHTS.get(nfft)
+    if weights is None:
+        weights = np.full(nfft // 2 + 1, 2.0)
+        weights[0] = 1.0
+        if nfft % 2 == 0:
+            weights[-1] = 1.0
+        _ANALYTIC_WEIGHTS[nfft] = weights
+    full = np.zeros(spec.shape[:-1] + (nfft,), dtype=np.complex128)
+    full[..., :nfft // 2 + 1] = spec * weights
+    return np.abs(np.fft.ifft(full, axis=-1)[..., :n])
+
+
+def hilbert_envelope(x):
+    """
+    Smooth outline ("envelope") of a wiggly signal, along the last axis.
+    A tone's envelope is flat instead of going up and down every cycle, so
+    its highest point is the middle of the pulse, not whichever cycle
+    happened to come out tallest. Uses the FFT (Hilbert transform).
+    """
+    x = np.asarray(x, dtype=np.float64)
+    n = x.shape[-1]
+    nfft = next_fast_len(n)
+    return _envelope_from_rfft(np.fft.rfft(x, nfft, axis=-1), nfft, n)
+
+
+_LOWPASS = {}
+
+
+def lowpass_envelope(x, sample_rate, cutoff_hz):
+    """
+    Envelope the simple way: flip the negative half up (rectify), then
+    smooth away the wiggles with a low-pass filter that lets through less
+    than cutoff_hz. The filter is worked out once per setting and applied
+    with an FFT; it doesn't shift anything in time.
+
+    We rectify by squaring (and take the square root at the end): abs()
+    makes sharp corners whose wiggles are too fast to record and fold back
+    down as slow ripples the filter can't remove.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    x = 2.0 * x * x
+    n = x.shape[-1]
+    half = int(2 * sample_rate / cutoff_hz)
+    nfft = next_fast_len(n + half)
+    key = (sample_rate, cutoff_hz, nfft)
+    spec = _LOWPASS.get(key)
+    if spec is None:
+        # Windowed sinc, centred on sample 0 (wrapped around) so it has no delay
+        k = np.arange(-half, half + 1)
+        kernel = np.sinc(2.0 * cutoff_hz / sample_rate * k) * np.blackman(2 * half + 3)[1:-1]
+        kernel /= kernel.sum()
+        wrapped = np.zeros(nfft)
+        wrapped[:half + 1] = kernel[half:]
+        wrapped[-half:] = kernel[:half]
+        spec = np.fft.rfft(wrapped)
+        _LOWPASS[key] = spec
+    smooth = np.fft.irfft(np.fft.rfft(x, nfft, axis=-1) * spec, nfft, axis=-1)[..., :n]
+    return np.sqrt(np.maximum(smooth, 0.0))
+
+
+_FILTERS = {}
+
+
+def buzzer_filter(sample_rate, on_ms, freq_hz):
+    """Matched filter for the standard buzzer pulse, built once per setting."""
+    key = (sample_rate, on_ms, freq_hz)
+    mf = _FILTERS.get(key)
+    if mf is None:
+        mf = MatchedFilter(make_buzzer_template(sample_rate, on_ms, freq_hz))
+        _FILTERS[key] = mf
+    return mf
+
+
+# How many samples on each side the sinc interpolator looks at.
+SINC_HALF_WIDTH = 16
+
+
+def _parabolic_offset(ym1, y0, yp1):
+    denom = ym1 - 2.0 * y0 + yp1
+    if denom >= 0:
+        # Not a peak shape (flat or bowl), so don't move.
+        return 0.0
+    return 0.5 * (ym1 - yp1) / denom
+
+
+def _sinc_offset(values, index):
+    lo = max(0, index - SINC_HALF_WIDTH)
+    hi = min(len(values), index + SINC_HALF_WIDTH + 1)
+    k = np.arange(lo, hi) - index
+    y = values[lo:hi]
+    # Try lots of positions between the neighbours, then polish the best one.
+    offsets = np.linspace(-1.0, 1.0, 129)
+    d = offsets[:, None] - k[None, :]
+    window = 0.5 * (1.0 + np.cos(np.pi * np.clip(d / (SINC_HALF_WIDTH + 1), -1.0, 1.0)))
+    curve = (np.sinc(d) * window) @ y
+    j = int(np.argmax(curve))
+    if 0 < j < len(curve) - 1:
+        step = offsets[1] - offsets[0]
+        return offsets[j] + step * _parabolic_offset(curve[j - 1], curve[j], curve[j + 1])
+    return offsets[j]
+
+
+def refine_peak(values, index, method="parabolic"):
+    """
+    Guess where the true peak is *between* samples.
+
+    values[index] should be the biggest positive sample near the peak.
+    method is "none", "parabolic", "gaussian" or "sinc" (band-limited).
+    Returns a float sample index.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    index = int(index)
+    if method == "none" or index <= 0 or index >= len(values) - 1:
+        return float(index)
+
+    ym1, y0, yp1 = values[index - 1], values[index], values[index + 1]
+    if method == "parabolic":
+        offset = _parabolic_offset(ym1, y0, yp1)
+    elif method == "gaussian":
+        if min(ym1, y0, yp1) <= 0:
+            offset = _parabolic_offset(ym1, y0, yp1)
+        else:
+            offset = _parabolic_offset(np.log(ym1), np.log(y0), np.log(yp1))
+    elif method == "sinc":
+        offset = _sinc_offset(values, index)
+    else:
+        raise ValueError(f"unknown peak refine method: {method!r}")
+
+    # A good peak never moves by more than one sample.
+    return index + float(np.clip(offset, -1.0, 1.0))
+
+
+def cfar_floor(loud, guard, train):
+    """
+    Local noise level around every sample, for a "constant false alarm
+    rate" (CFAR) detector: the RMS of `train` samples on each side, leaving
+    out the `guard` samples right next to it (so a peak doesn't raise its
+    own floor). The louder side wins, so the quiet end of something loud
+    (like the buzzer ringing) doesn't look like an echo.
+    Works along the last axis, in O(n) using running sums.
+    """
+    loud = np.asarray(loud, dtype=np.float64)
+    n = loud.shape[-1]
+    c = np.concatenate((np.zeros(loud.shape[:-1] + (1,)), np.cumsum(loud * loud, axis=-1)), axis=-1)
+    i = np.arange(n)
+
+    def side(lo, hi):
+        lo = np.clip(lo, 0, n)
+        hi = np.clip(hi, 0, n)
+        return (c[..., hi] - c[..., lo]) / np.maximum(hi - lo, 1)
+
+    left = side(i - guard - train, i - guard)
+    right = side(i + guard + 1, i + guard + train + 1)
+    return np.sqrt(np.maximum(left, right))
+
+
+def _detector_output(waves, sample_rate, detector, pulse_ms, pulse_freq_hz, matched_filter, envelope="none"):
+    # (score, loud): the detector output, for refining peaks, and how loud
+    # it is at each sample, for picking them. With an envelope, both are
+    # the envelope, so peaks are found on the outline, not the wiggles.
+    mf = None
+    if detector == "matched":
+        mf = matched_filter
+        if mf is None:
+            mf = buzzer_filter(sample_rate, pulse_ms, pulse_freq_hz)
+    if envelope == "hilbert":
+        loud = mf.envelope(waves) if mf is not None else hilbert_envelope(waves)
+        return loud.copy(), loud
+    score = mf.correlate(waves) if mf is not None else np.asarray(waves, dtype=np.float64)
+    if envelope == "rectify":
+        loud = lowpass_envelope(score, sample_rate, pulse_freq_hz / 2.0)
+        return loud.copy(), loud
+    if envelope != "none":
+        raise ValueError(f"unknown envelope: {envelope!r}")
+    return score, np.abs(score)
+
+
+def echo_times_ms(waves, sample_rate, beep_indexes=None, pulse_ms=8, pulse_freq_hz=2700,
+                  detector="matched", refine="parabolic", time_from="beep",
+                  search_start_ms=6, search_end_ms=35, matched_filter=None,
+                  cfar_margin_db=None, cfar_guard_ms=None, cfar_train_ms=None, envelope="none",
+                  search_window_ms=None):
+    """
+    Find the echo time (ms) in each row of waves, all rows at once with one
+    big FFT and one argmax.
+
+    - detector: "matched" (compare with a pulse_ms buzzer tone at
+      pulse_freq_hz) or "loudest" (biggest sample)
+    - refine: how to find the peak between samples (see refine_peak)
+    - envelope: pick peaks on the smooth outline of the detector output
+      instead of its wiggles: "hilbert" (see hilbert_envelope), "rectify"
+      (see lowpass_envelope, cut off at half of pulse_freq_hz) or "none"
+    - beep_indexes: sample where each beep started, or None if unknown.
+      Known beeps are the zero for that shot's time, and only the beep
+      itself is skipped. Unknown ones use the start of the recording and
+      only search from search_start_ms.
+    - time_from: "direct" to use the buzzer sound heard in the recording as
+      the zero instead: the peak of the same detector output, found near
+      the beep (or before search_start_ms if the beep is unknown). Echo and
+      direct sound are then timed the same way, peak to peak, so fixed
+      delays cancel.
+    - search_end_ms: don't look for echoes after this long (None: to the end)
+    - search_window_ms: (earliest, latest) echo time we expect, e.g. from
+      the temperature (see airspeed.echo_window_ms). Shots with a known
+      zero are only searched there, and only that part of the recordings
+      (plus a little around it) goes through the detector, which is quicker
+      and can't lock on to something far from the echo.
+    - cfar_margin_db: instead of the biggest peak, take the first one that
+      is this much louder than the noise around it (see cfar_floor), over
+      cfar_train_ms (default pulse_ms) either side, skipping cfar_guard_ms
+      (default half of pulse_ms). Shots with no such peak give NaN, so they
+      can be thrown out.
+    - matched_filter: a MatchedFilter to use instead of the buzzer tone,
+      e.g. for a coded ping (see excitation.py). Then pulse_ms should be
+      how long to skip after the start, not the length of the sound.
+    """
+    waves = np.asarray(waves)
+    n_shots, n = waves.shape
+
+    # Where each shot's clock starts (NaN = start of the recording)
+    origins = np.full(n_shots, np.nan)
+    if beep_indexes is not None:
+        for k, b in enumerate(beep_indexes):
+            if b is not None:
+                origins[k] = b
+
+    def ms_to_index(ms):
+        return int((ms / 1000.0) * sample_rate)
+
+    detected = None
+    if time_from == "direct":
+        score, loud = detected = _detector_output(waves, sample_rate, detector, pulse_ms, pulse_freq_hz,
+                                                  matched_filter, envelope)
+        for k in range(n_shots):
+            if np.isnan(origins[k]):
+                lo, hi = 0, ms_to_index(search_start_ms)
+            else:
+                lo = max(0, int(np.floor(origins[k])))
+                hi = lo + ms_to_index(pulse_ms) + 1
+            window = loud[k, lo:hi]
+            # Only trust it if the direct sound clearly stands out
+            if len(window) == 0 or not window.max() > 4.0 * np.median(loud[k]):
+                continue
+            p = lo + int(np.argmax(window))
+            sign = 1.0 if score[k, p] >= 0 else -1.0
+            origins[k] = refine_peak(sign * score[k], p, refine)
+
+    known = ~np.isnan(origins)
+    origin = np.where(known, origins, 0.0)
+    # The echo can't start until the beep itself is over.
+    i1 = np.where(known, np.ceil(origin) + ms_to_index(pulse_ms), ms_to_index(search_start_ms))
+    i2 = np.floor(origin) + ms_to_index(search_end_ms) if search_end_ms is not None else np.full(n_shots, n)
+    if search_window_ms is not None:
+        i1 = np.where(known, np.maximum(i1, np.ceil(origin) + ms_to_index(search_window_ms[0])), i1)
+        i2 = np.where(known, np.minimum(i2, np.floor(origin) + ms_to_index(search_window_ms[1])), i2)
+
+    # Safety clamps
+    i1 = np.clip(i1, 0, n).astype(int)
+    i2 = np.clip(i2, 0, n).astype(int)
+    guard = ms_to_index(pulse_ms / 2.0 if cfar_guard_ms is None else cfar_guard_ms)
+    train = max(1, ms_to_index(pulse_ms if cfar_train_ms is None else cfar_train_ms))
+
+    if search_window_ms is not None and detected is None:
+        # Only work out the part we'll search, with room on each side for the
+        # template to slide off the end and for CFAR and the envelope to see
+        # around it.
+        template = len(matched_filter.template) if matched_filter is not None else ms_to_index(pulse_ms)
+        pad = 2 * template + guard + train
+        first = max(0, int(i1.min()) - pad)
+        last = min(n, int(i2.max()) + pad)
+        if last > first:
+            waves = waves[:, first:last]
+            origin = origin - first
+            i1, i2 = i1 - first, i2 - first
+            n = last - first
+
+    if detected is None:
+        score, loud = _detector_output(waves, sample_rate, detector, pulse_ms, pulse_freq_hz, matched_filter,
+                                       envelope)
+
+    # Zero out the part we don't want to consider
+    idx = np.arange(n)
+    outside = (idx < i1[:, None]) | (idx >= i2[:, None])
+
+    if cfar_margin_db is not None:
+        floor = cfar_floor(loud, guard, train)
+        hits = loud > 10.0 ** (cfar_margin_db / 20.0) * floor
+        hits[outside] = False
+    loud[outside] = 0.0
+
+    peak_index = np.argmax(loud, axis=1)
+    peak_ms = np.empty(n_shots)
+    for k in range(n_shots):
+        p = int(peak_index[k])
+        if cfar_margin_db is not None:
+            if not hits[k].any():
+                peak_ms[k] = np.nan
+                continue
+            # The first bunch of samples that stand out (gaps shorter than the
+            # guard don't split it) is the first echo; use its top
+            where = np.flatnonzero(hits[k])
+            breaks = np.flatnonzero(np.diff(where) > max(1, guard))
+            end = where[breaks[0]] + 1 if len(breaks) else where[-1] + 1
+            p = where[0] + int(np.argmax(loud[k, where[0]:end]))
+        # Flip the signal if the peak points down, so the refiner sees a hill.
+        sign = 1.0 if score[k, p] >= 0 else -1.0
+        peak_pos = refine_peak(sign * score[k], p, refine)
+        peak_ms[k] = ((peak_pos - origin[k]) / sample_rate) * 1000.0
+    return peak_ms
+
+
+def find_echoes(wave, sample_rate, beep_index=None, pulse_ms=8, pulse_freq_hz=2700, matched_filter=None,
+                detector="matched", refine="parabolic", search_start_ms=6, search_end_ms=None,
+                min_gap_ms=None, min_snr=4.0, max_echoes=8, envelope="none"):
+    """
+    Find every echo that stands out in one recording, not just the biggest.
+
+    Works like echo_times_ms (same detector settings), then keeps picking
+    the next biggest peak, skipping min_gap_ms (default pulse_ms) either
+    side of the ones already found, until the peaks are less than min_snr
+    times the noise level. search_end_ms=None searches to the end.
+
+    Returns a list of dicts, earliest first:
+    - time_ms: from the beep (or the start of the recording if unknown)
+    - amplitude: how big the matched filter peak is
+    - snr: amplitude / noise level
+    - confidence: 0..1, how unlikely it is that noise alone made a peak this big
+    """
+    score, loud = _detector_output(wave, sample_rate, detector, pulse_ms, pulse_freq_hz, matched_filter, envelope)
+    n = len(score)
+
+    def ms_to_index(ms):
+        return int((ms / 1000.0) * sample_rate)
+
+    origin = 0.0 if beep_index is None else float(beep_index)
+    i1 = int(np.ceil(origin)) + ms_to_index(pulse_ms) if beep_index is not None else ms_to_index(search_start_ms)
+    i2 = n if search_end_ms is None else int(np.floor(origin)) + ms_to_index(search_end_ms)
+    i1, i2 = max(0, min(n, i1)), max(0, min(n, i2))
+    if i2 <= i1:
+        return []
+
+    loud = loud[i1:i2].copy()
+    # Typical noise size, not fooled by the echoes themselves: the median of
+    # |noise| is 0.67 sigma, of a noise envelope 1.18 sigma
+    noise = np.median(loud) / (0.6745 if envelope == "none" else 1.1774)
+    if not noise > 0:
+        return []
+    gap = max(1, ms_to_index(pulse_ms if min_gap_ms is None else min_gap_ms))
+    n_cells = max(1, len(loud) // gap)     # how many chances noise had to fake a peak
+
+    echoes = []
+    while len(echoes) < max_echoes:
+        p = int(np.argmax(loud))
+        snr = loud[p] / noise
+        if snr < min_snr:
+            break
+        loud[max(0, p - gap):p + gap + 1] = 0.0
+        p += i1
+        sign = 1.0 if score[p] >= 0 else -1.0
+        peak_pos = refine_peak(sign * score, p, refine)
+        echoes.append({
+            "time_ms": (peak_pos - origin) / sample_rate * 1000.0,
+            "amplitude": float(abs(score[p])),
+            "snr": float(snr),
+            "confidence": float(np.clip(1.0 - n_cells * np.exp(-0.5 * snr * snr), 0.0, 1.0)),
+        })
+    return sorted(echoes, key=lambda e: e["time_ms"])
+
+
+def fit_echo_train(echoes, distance_m):
+    """
+    Echo k (k = 1, 2, 3...) comes back after k round trips, so its time is
+    latency + k * round_trip. Fit that straight line to the echoes from
+    find_echoes. The loudest echo is taken to be the first round trip
+    (each trip loses some sound); the others are numbered from it, keeping
+    the biggest one for each k and ignoring ones that don't land near a
+    whole number of round trips (bounces, ringing). The slope is the round
+    trip time, with any fixed delay (latency) taken out.
+
+    Returns None with fewer than two round trips, else a dict with
+    round_trip_ms, latency_ms, speed_m_per_s, orders, times_ms and
+    round_trip_err_ms (its standard error; NaN with only two echoes).
+    """
+    if not echoes:
+        return None
+    first = max(echoes, key=lambda e: e["amplitude"])["time_ms"]
+    if first <= 0:
+        return None
+    best = {}
+    for e in echoes:
+        ratio = e["time_ms"] / first
+        order = int(round(ratio))
+        if order < 1 or abs(ratio - order) > 0.25:
+            continue
+        if order not in best or e["amplitude"] > best[order]["amplitude"]:
+            best[order] = e
+    if len(best) < 2:
+        return None
+
+    orders = np.array(sorted(best), dtype=np.float64)
+    times = np.array([best[k]["time_ms"] for k in sorted(best)])
+    round_trip, latency = np.polyfit(orders, times, 1)
+    err = np.nan
+    if len(orders) > 2:
+        resid = times - (latency + round_trip * orders)
+        err = np.sqrt(np.sum(resid * resid) / (len(orders) - 2) / np.sum((orders - orders.mean()) ** 2))
+    return {
+        "round_trip_ms": float(round_trip),
+        "latency_ms": float(latency),
+        "speed_m_per_s": speed_m_per_s(round_trip, distance_m),
+        "orders": [int(k) for k in orders],
+        "times_ms": [float(t) for t in times],
+        "round_trip_err_ms": float(err),
+    }
+
+
+def speed_m_per_s(echo_time_ms, distance_m):
+    """Speed of sound from a round trip: (2 * distance) / time."""
+    t = echo_time_ms / 1000.0
+    if t <= 0:
+        return 0.0
+    return (2.0 * distance_m) / t
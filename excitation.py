@@ -0,0 +1,257 @@
+#  Copyright 2026 Nolan Stokely <nolan@stokely.org>
+"""
+Coded pings: long sounds that still give a sharp echo.
+
+A short beep gives a sharp echo but not much sound, so the echo is weak
+next to the noise. A long beep is loud but smears the echo out. Coded
+pings get both: we send a long sound with a pattern we know, and the
+matched filter (echofinder.MatchedFilter) squeezes it back into one narrow
+peak ("pulse compression"). A 13-chip Barker code has 13 times the sound
+of one chip, but its peak is still only about one chip wide.
+
+- Beep: the normal single buzzer pulse
+- KeyedCode: the GPIO buzzer switched on and off in a Barker or MLS
+  (maximum length sequence) pattern of "chips"
+- Chirp: a tone sweeping from f0_hz to f1_hz, played through a speaker
+  on the sound card output (the buzzer can't change pitch)
+
+Each one can send() itself, gives the sound() to play through a speaker
+instead (see RingRecorder.play) and the matched_filter() to find it with.
+make_excitation("barker13") etc. builds one from a name.
+"""
+import numpy as np
+
+from echofinder import MatchedFilter, buzzer_filter, make_buzzer_template
+
+# Barker codes: every shifted copy overlaps the original by at most 1 chip.
+BARKER = {
+    2: [1, -1],
+    3: [1, 1, -1],
+    4: [1, 1, -1, 1],
+    5: [1, 1, 1, -1, 1],
+    7: [1, 1, 1, -1, -1, 1, -1],
+    11: [1, 1, 1, -1, -1, -1, 1, -1, -1, 1, -1],
+    13: [1, 1, 1, 1, 1, -1, -1, 1, 1, -1, 1, -1, 1],
+}
+
+# Shift register taps that make a maximum length sequence, by register length.
+MLS_TAPS = {
+    3: (3, 2), 4: (4, 3), 5: (5, 3), 6: (6, 5), 7: (7, 6),
+    8: (8, 6, 5, 4), 9: (9, 5), 10: (10, 7),
+}
+
+# Even a perfectly compressed echo sits next to the direct sound and its
+# bounces, so never look for an echo sooner than this after a chirp starts.
+MIN_BLANK_MS = 2.0
+
+
+def barker(n=13):
+    """Barker code of length n as an array of +1/-1."""
+    if n not in BARKER:
+        raise ValueError(f"no Barker code of length {n} (try {sorted(BARKER)})")
+    return np.array(BARKER[n], dtype=np.float64)
+
+
+def mls(order=7):
+    """
+    Maximum length sequence, 2**order - 1 chips of +1/-1, from a shift
+    register. Starts with `order` +1 chips, so the buzzer starts on.
+    """
+    if order not in MLS_TAPS:
+        raise ValueError(f"no MLS taps for order {order} (try {sorted(MLS_TAPS)})")
+    taps = MLS_TAPS[order]
+    state = [1] * order
+    out = np.empty(2 ** order - 1)
+    for i in range(len(out)):
+        out[i] = 1.0 if state[-1] else -1.0
+        feedback = 0
+        for t in taps:
+            feedback ^= state[t - 1]
+        state = [feedback] + state[:-1]
+    return out
+
+
+def chip_runs(code):
+    """
+    Group a +1/-1 code into (first_chip, n_on, n_off): each stretch of +1
+    chips and the -1 chips after it. The code must start with +1.
+    """
+    code = np.asarray(code)
+    if len(code) == 0 or code[0] <= 0:
+        raise ValueError("code must start with a +1 chip")
+    runs = []
+    i = 0
+    while i < len(code):
+        first = i
+        while i < len(code) and code[i] > 0:
+            i += 1
+        n_on = i - first
+        while i < len(code) and code[i] <= 0:
+            i += 1
+        runs.append((first, n_on, i - first - n_on))
+    return runs
+
+
+def chirp(sample_rate, length_ms, f0_hz, f1_hz, sweep="linear", fade_ms=0.5):
+    """
+    Tone sweeping from f0_hz to f1_hz over length_ms, "linear" (same number
+    of Hz every ms) or "exponential" (same number of octaves every ms),
+    faded in and out over fade_ms so the speaker doesn't click.
+    """
+    n = max(1, int(round(length_ms / 1000.0 * sample_rate)))
+    t = np.arange(n) / float(sample_rate)
+    length_s = length_ms / 1000.0
+    if sweep == "linear":
+        phase = f0_hz * t + 0.5 * (f1_hz - f0_hz) / length_s * t * t
+    elif sweep == "exponential":
+        k = np.log(f1_hz / f0_hz) / length_s
+        phase = f0_hz * np.expm1(k * t) / k
+    else:
+        raise ValueError(f"unknown chirp sweep: {sweep!r}")
+    wave = np.sin(2.0 * np.pi * phase)
+    fade = max(1, int(fade_ms / 1000.0 * sample_rate))
+    if 2 * fade < n:
+        ramp = 0.5 - 0.5 * np.cos(np.pi * np.arange(fade) / fade)
+        wave[:fade] *= ramp
+        wave[-fade:] *= ramp[::-1]
+    return wave
+
+
+class Beep:
+    """The normal single buzzer pulse, on_ms long."""
+
+    kind = "gpio"
+
+    def __init__(self, on_ms=8, freq_hz=2700):
+        self.on_ms = on_ms
+        self.freq_hz = freq_hz
+        self.length_ms = on_ms
+        # An echo can't be told apart until the beep itself is over
+        self.blank_ms = on_ms
+
+    def pattern(self):
+        return [(self.on_ms * 1000, 0)]
+
+    def send(self, pulser, backend=None, sample_rate=None):
+        """Beep. Returns time.perf_counter_ns() when the sound started."""
+        return pulser.pulse(self.on_ms * 1000)
+
+    def sound(self, sample_rate):
+        return make_buzzer_template(sample_rate, self.on_ms, self.freq_hz)
+
+    def matched_filter(self, sample_rate):
+        return buzzer_filter(sample_rate, self.on_ms, self.freq_hz)
+
+
+class KeyedCode:
+    """
+    The buzzer switched on for every +1 chip and off for every -1 chip,
+    chip_us per chip. Uses pulser.train(), so the chips are as exact as the
+    pulser (see pulses.py).
+    """
+
+    kind = "gpio"
+
+    def __init__(self, code, chip_us=1000, freq_hz=2700):
+        self.code = np.asarray(code, dtype=np.float64)
+        self.runs = chip_runs(self.code)
+        self.chip_us = chip_us
+        self.freq_hz = freq_hz
+        self.length_ms = len(self.code) * chip_us / 1000.0
+        # An on/off buzzer code doesn't cancel perfectly, so the loud direct
+        # sound leaves ripples until the code is over. Codes must therefore
+        # be shorter than the echo time (barker13 is good for a 3 m tube).
+        self.blank_ms = max(MIN_BLANK_MS, self.length_ms)
+        self._filters = {}
+
+    def pattern(self):
+        """[(on_us, off_us), ...] for pulser.train()."""
+        return [(n_on * self.chip_us, n_off * self.chip_us) for _, n_on, n_off in self.runs]
+
+    def send(self, pulser, backend=None, sample_rate=None):
+        """Play the code. Returns time.perf_counter_ns() at the first chip."""
+        return pulser.train(self.pattern())
+
+    def sound(self, sample_rate):
+        """The buzzer tone during +1 chips and silence during -1 chips."""
+        return self._keyed_tone(sample_rate, 0.0)
+
+    def template(self, sample_rate):
+        """
+        What to compare the recording with: the buzzer tone during +1 chips
+        and the same tone flipped over during -1 chips. Flipping the off
+        chips cancels the "something is beeping" part, so what's left is
+        the code's own sharp correlation.
+        """
+        return self._keyed_tone(sample_rate, -1.0)
+
+    def _keyed_tone(self, sample_rate, off_sign):
+        chip = self.chip_us / 1e6 * sample_rate
+        n = int(round(len(self.code) * chip))
+        out = np.zeros(n)
+        for first, n_on, n_off in self.runs:
+            # The buzzer starts its tone afresh every time it switches on
+            for sign, i0, n_chips in ((1.0, first, n_on), (off_sign, first + n_on, n_off)):
+                a = int(round(i0 * chip))
+                b = int(round((i0 + n_chips) * chip))
+                if b > a:
+                    t = np.arange(b - a) / float(sample_rate)
+                    out[a:b] = sign * np.sin(2.0 * np.pi * self.freq_hz * t)
+        return out
+
+    def matched_filter(self, sample_rate):
+        mf = self._filters.get(sample_rate)
+        if mf is None:
+            mf = MatchedFilter(self.template(sample_rate))
+            self._filters[sample_rate] = mf
+        return mf
+
+
+class Chirp:
+    """A frequency sweep played through the sound card (see chirp())."""
+
+    kind = "audio"
+
+    def __init__(self, f0_hz=1000, f1_hz=8000, length_ms=10, sweep="linear", fade_ms=0.5):
+        self.f0_hz = f0_hz
+        self.f1_hz = f1_hz
+        self.length_ms = length_ms
+        self.sweep = sweep
+        self.fade_ms = fade_ms
+        # The compressed echo wiggles at about the middle pitch of the sweep
+        self.freq_hz = (f0_hz + f1_hz) / 2.0
+        self.blank_ms = MIN_BLANK_MS
+        self._filters = {}
+
+    def sound(self, sample_rate):
+        return chirp(sample_rate, self.length_ms, self.f0_hz, self.f1_hz, self.sweep, self.fade_ms)
+
+    def send(self, pulser, backend, sample_rate):
+        """Play the chirp. Returns time.perf_counter_ns() when it should start coming out."""
+        return backend.play(self.sound(sample_rate).astype(np.float32), sample_rate)
+
+    def matched_filter(self, sample_rate):
+        mf = self._filters.get(sample_rate)
+        if mf is None:
+            mf = MatchedFilter(self.sound(sample_rate))
+            self._filters[sample_rate] = mf
+        return mf
+
+
+def make_excitation(name, beep_ms=8, freq_hz=2700, chip_us=1000):
+    """
+    Build an excitation from its name:
+    "beep", "barker<N>" (e.g. barker13), "mls<N>" (e.g. mls4),
+    "chirp" (linear sweep) or "expchirp" (exponential sweep).
+    """
+    name = name.lower()
+    if name == "beep":
+        return Beep(beep_ms, freq_hz)
+    if name == "chirp":
+        return Chirp(sweep="linear")
+    if name == "expchirp":
+        return Chirp(sweep="exponential")
+    for prefix, make in (("barker", barker), ("mls", mls)):
+        if name.startswith(prefix) and name[len(prefix):].isdigit():
+            return KeyedCode(make(int(name[len(prefix):])), chip_us, freq_hz)
+    raise ValueError(f"unknown excitation: {name!r} (try beep, barker13, mls4, chirp or expchirp)")
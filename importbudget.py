@@ -0,0 +1,72 @@
+#!/home/murray/env/bin/python3
+#  Copyright 2026 Nolan Stokely <nolan@stokely.org>
+"""
+How long does it take to import our programs?
+
+Runs `python -X importtime -c "import <module>"` in a fresh Python, adds up
+the numbers and complains if a module takes longer than the budget, or if
+it pulls in one of the slow libraries we want to load later.
+
+    python importbudget.py scifairgui scifair --budget-ms 300
+"""
+import argparse
+import subprocess
+import sys
+
+# These should only be imported when they're actually used.
+SLOW_MODULES = ["matplotlib", "sounddevice", "gpiozero"]
+
+
+def measure(module):
+    """Return a list of (name, self_us, cumulative_us, depth) for importing module."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        errors = [line for line in proc.stderr.splitlines() if not line.startswith("import time:")]
+        raise RuntimeError(f"importing {module} failed:\n" + "\n".join(errors))
+
+    rows = []
+    for line in proc.stderr.splitlines():
+        # import time:       self [us] |  cumulative | imported package
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return rows
+
+
+def report(module, budget_ms, top=10):
+    """Print the import cost of module. Returns True if it is within budget."""
+    rows = measure(module)
+    total_us = next((cum for name, _, cum, depth in rows if name == module and depth == 0), 0)
+    names = {name.split(".")[0] for name, _, _, _ in rows}
+    slow = [m for m in SLOW_MODULES if m in names]
+
+    ok = total_us / 1000.0 <= budget_ms and not slow
+    print(f"{module}: {total_us / 1000.0:.1f} ms (budget {budget_ms:.0f} ms) {'OK' if ok else 'OVER'}")
+    for name, self_us, _, _ in sorted(rows, key=lambda r: -r[1])[:top]:
+        print(f"  {self_us / 1000.0:8.1f} ms  {name}")
+    if slow:
+        print(f"  imported at startup but should be lazy: {', '.join(slow)}")
+    return ok
+
+
+def main(args):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("modules", nargs="*", default=["scifairgui", "scifair"])
+    parser.add_argument("--budget-ms", type=float, default=300.0, help="most time a module may take to import")
+    parser.add_argument("--top", type=int, default=10, help="how many of the slowest imports to list")
+    opts = parser.parse_args(args)
+
+    ok = True
+    for module in opts.modules:
+        ok = report(module, opts.budget_ms, opts.top) and ok
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,158 @@
+#  Copyright 2026 Nolan Stokely <nolan@stokely.org>
+"""
+Find echoes on every core at once.
+
+echo_times_ms on a big batch uses one core, and a Pi has four. A
+ParallelDetector keeps a few worker processes running and hands each of
+them a slice of the batch. The shots are not sent to the workers (copying
+thousands of shots through a pipe would take longer than finding the
+echoes): they are put in a block of shared memory that every process can
+see, and the workers write their answers into a second shared block, a
+NumPy structured array (see RESULT_DTYPE). The blocks are kept and reused
+for the next batch, and only made bigger when a batch doesn't fit.
+
+The workers are started by a small "forkserver" process (or from scratch
+where there is none), not copied from this one: the GUI has Tk, the
+microphone and maybe sonar running in other threads, and copying a
+process in the middle of that can leave a worker stuck forever.
+
+    detector = ParallelDetector(48000, distance_m=3.0, pulse_ms=8, envelope="hilbert")
+    results = detector.detect(waves, beep_indexes)
+    results["echo_ms"], results["speed_m_per_s"]
+    detector.close()
+"""
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from echofinder import echo_times_ms, speed_m_per_s
+
+RESULT_DTYPE = np.dtype([
+    ("beep_index", "f8"),       # NaN = unknown
+    ("echo_ms", "f8"),          # NaN = no clear echo
+    ("speed_m_per_s", "f8"),
+])
+
+# Fewer shots than this per worker isn't worth the trip to another process
+MIN_CHUNK_SHOTS = 16
+
+START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+
+def _attach(name):
+    try:
+        # Python 3.13+: don't let the worker's exit clean up our block
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        return shared_memory.SharedMemory(name=name)
+
+
+# Set up once in each worker process by _init_worker
+_worker = {}
+
+
+def _init_worker(sample_rate, distance_m, settings):
+    _worker.update(sample_rate=sample_rate, distance_m=distance_m, settings=settings, blocks={})
+
+
+def _block(name):
+    blocks = _worker["blocks"]
+    if name not in blocks:
+        blocks[name] = _attach(name)
+    return blocks[name]
+
+
+def _forget_blocks(keep):
+    blocks = _worker["blocks"]
+    for name in [n for n in blocks if n not in keep]:
+        blocks.pop(name).close()
+
+
+def _detect_slice(task):
+    """Find the echoes in shots a..b of the shared batch (runs in a worker)."""
+    waves_name, results_name, shape, a, b, overrides = task
+    _forget_blocks((waves_name, results_name))
+    waves = np.ndarray(shape, np.float32, buffer=_block(waves_name).buf)
+    results = np.ndarray(shape[0], RESULT_DTYPE, buffer=_block(results_name).buf)
+    out = results[a:b]
+    beep_indexes = out["beep_index"].tolist()
+    settings = dict(_worker["settings"], **overrides)
+    echo_ms = echo_times_ms(waves[a:b], _worker["sample_rate"], beep_indexes, **settings)
+    out["echo_ms"] = echo_ms
+    out["speed_m_per_s"] = [speed_m_per_s(t, _worker["distance_m"]) for t in echo_ms]
+    return b - a
+
+
+class ParallelDetector:
+    """
+    echo_times_ms (with **settings, e.g. pulse_ms, matched_filter,
+    cfar_margin_db, envelope) spread over `workers` processes (default: one
+    per core). Call close() when done, or use it in a with block.
+    """
+
+    def __init__(self, sample_rate, distance_m, workers=None, **settings):
+        self.sample_rate = sample_rate
+        self.workers = workers or os.cpu_count() or 1
+        self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context(START_METHOD),
+                                         initializer=_init_worker, initargs=(sample_rate, distance_m, settings))
+        self._waves = None
+        self._results = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _buffers(self, n_shots, n):
+        """Shared blocks big enough for n_shots shots of n samples."""
+        need = (n_shots * n * 4, n_shots * RESULT_DTYPE.itemsize)
+        if self._waves is None or self._waves.size < need[0] or self._results.size < need[1]:
+            self._free()
+            # Leave room to grow, so a slightly bigger batch doesn't mean new blocks
+            self._waves = shared_memory.SharedMemory(create=True, size=max(1, 2 * need[0]))
+            self._results = shared_memory.SharedMemory(create=True, size=max(1, 2 * need[1]))
+        waves = np.ndarray((n_shots, n), np.float32, buffer=self._waves.buf)
+        results = np.ndarray(n_shots, RESULT_DTYPE, buffer=self._results.buf)
+        return waves, results
+
+    def detect(self, waves, beep_indexes=None, out=None, **overrides):
+        """
+        Find the echo in each row of waves. Returns a structured array
+        (RESULT_DTYPE) with one entry per shot, or fills in `out` if given.
+        **overrides change settings for this batch only (e.g. search_window_ms).
+        """
+        waves = np.asarray(waves)
+        n_shots, n = waves.shape
+        if out is None:
+            out = np.empty(n_shots, RESULT_DTYPE)
+        shared, results = self._buffers(n_shots, n)
+        shared[:] = waves
+        results["beep_index"] = np.nan
+        if beep_indexes is not None:
+            results["beep_index"] = [np.nan if b is None else b for b in beep_indexes]
+
+        # About two slices per worker, so a slow one doesn't hold everyone up
+        chunk = max(MIN_CHUNK_SHOTS, -(-n_shots // (2 * self.workers)))
+        tasks = [(self._waves.name, self._results.name, (n_shots, n), a, min(a + chunk, n_shots), overrides)
+                 for a in range(0, n_shots, chunk)]
+        for _ in self._pool.map(_detect_slice, tasks):
+            pass
+        out[:] = results
+        # Don't keep views of the shared blocks around, so they can be freed
+        del shared, results
+        return out
+
+    def _free(self):
+        for block in (self._waves, self._results):
+            if block is not None:
+                block.close()
+                block.unlink()
+        self._waves = self._results = None
+
+    def close(self):
+        self._pool.shutdown()
+        self._free()
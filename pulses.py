@@ -0,0 +1,194 @@
+#  Copyright 2026 Nolan Stokely <nolan@stokely.org>
+"""
+Exact-length buzzer pulses.
+
+`buzzer.on(); time.sleep(0.008); buzzer.off()` can be off by a millisecond
+or more when the computer is busy. Here the pulse is timed by the Pi's
+hardware when we can (lgpio or pigpio), and otherwise by watching
+time.perf_counter_ns() closely ("spin-waiting") instead of trusting sleep.
+
+Every pulser has:
+    pulse(width_us)     one pulse
+    train(pattern)      several, pattern = [(on_us, off_us), ...]
+    close()
+and both pulse functions return time.perf_counter_ns() at the first rising
+edge, so the recording can be lined up with it.
+"""
+import sys
+import time
+
+# sleep() is only good to about a millisecond, so stop sleeping this long
+# before a deadline and spin for the rest.
+SPIN_NS = 1_500_000
+
+# While pulsing, other threads must give the interpreter back this often.
+SWITCH_INTERVAL_S = 0.00005
+
+
+def wait_until(deadline_ns):
+    """Return as close as we can to time.perf_counter_ns() == deadline_ns."""
+    while True:
+        left = deadline_ns - time.perf_counter_ns()
+        if left <= 0:
+            return
+        if left > SPIN_NS:
+            time.sleep((left - SPIN_NS) / 1e9)
+
+
+class SoftwarePulser:
+    """
+    Pulses any on()/off() device (a gpiozero output, a SimBuzzer, a MockPin)
+    with spin-waited timing. Edges are scheduled from the first edge, so
+    small delays don't add up over a long train.
+    """
+
+    def __init__(self, device):
+        self.device = device
+
+    def pulse(self, width_us):
+        return self.train([(width_us, 0)])
+
+    def train(self, pattern):
+        # Other Python threads can hold on to the interpreter for up to
+        # 5 ms at a time; ask them to hand it back much sooner while we pulse.
+        old_interval = sys.getswitchinterval()
+        sys.setswitchinterval(SWITCH_INTERVAL_S)
+        try:
+            before = time.perf_counter_ns()
+            self.device.on()
+            after = time.perf_counter_ns()
+            start = (before + after) // 2
+            t = start
+            for k, (on_us, off_us) in enumerate(pattern):
+                if k > 0:
+                    self.device.on()
+                t += int(on_us * 1000)
+                wait_until(t)
+                self.device.off()
+                t += int(off_us * 1000)
+                wait_until(t)
+        finally:
+            sys.setswitchinterval(old_interval)
+        return start
+
+    def close(self):
+        self.device.close()
+
+
+class LgpioPulser:
+    """Pulses timed by lgpio (Pi 5 and newer Pi OS)."""
+
+    def __init__(self, pin, chip=0):
+        import lgpio
+        self.lgpio = lgpio
+        self.pin = pin
+        self.handle = lgpio.gpiochip_open(chip)
+        # Waves are sent to a group, so claim the pin as a group of one
+        lgpio.group_claim_output(self.handle, [pin], [0])
+
+    def pulse(self, width_us):
+        return self.train([(width_us, 0)])
+
+    def train(self, pattern):
+        lg = self.lgpio
+        # pulse(levels, mask, delay_us); our pin is bit 0 of its group
+        pulses = []
+        for on_us, off_us in pattern:
+            pulses.append(lg.pulse(1, 1, int(on_us)))
+            pulses.append(lg.pulse(0, 1, max(1, int(off_us))))
+        start = time.perf_counter_ns()
+        lg.tx_wave(self.handle, self.pin, pulses)
+        total_us = sum(on + off for on, off in pattern)
+        wait_until(start + int(total_us * 1000))
+        while lg.tx_busy(self.handle, self.pin, lg.TX_WAVE):
+            time.sleep(0.0002)
+        return start
+
+    def close(self):
+        self.lgpio.group_write(self.handle, self.pin, 0)
+        self.lgpio.group_free(self.handle, self.pin)
+        self.lgpio.gpiochip_close(self.handle)
+
+
+class PigpioPulser:
+    """Pulses timed by the pigpio daemon's DMA waves (needs `sudo pigpiod`)."""
+
+    def __init__(self, pin):
+        import pigpio
+        self.pigpio = pigpio
+        self.pin = pin
+        self.pi = pigpio.pi()
+        if not self.pi.connected:
+            raise RuntimeError("pigpio daemon is not running")
+        self.pi.set_mode(pin, pigpio.OUTPUT)
+        self.pi.write(pin, 0)
+
+    def pulse(self, width_us):
+        return self.train([(width_us, 0)])
+
+    def train(self, pattern):
+        pg = self.pigpio
+        mask = 1 << self.pin
+        pulses = []
+        for on_us, off_us in pattern:
+            pulses.append(pg.pulse(mask, 0, int(on_us)))
+            pulses.append(pg.pulse(0, mask, max(1, int(off_us))))
+        self.pi.wave_clear()
+        self.pi.wave_add_generic(pulses)
+        wave_id = self.pi.wave_create()
+        start = time.perf_counter_ns()
+        self.pi.wave_send_once(wave_id)
+        total_us = sum(on + off for on, off in pattern)
+        wait_until(start + int(total_us * 1000))
+        while self.pi.wave_tx_busy():
+            time.sleep(0.0002)
+        self.pi.wave_delete(wave_id)
+        return start
+
+    def close(self):
+        self.pi.write(self.pin, 0)
+        self.pi.stop()
+
+
+class MockPin:
+    """
+    Pretend output pin for testing pulse timing without a Pi: remembers
+    every edge as (time.perf_counter_ns(), 1 or 0).
+    """
+
+    def __init__(self):
+        self.edges = []
+        self.value = 0
+
+    def on(self):
+        self.value = 1
+        self.edges.append((time.perf_counter_ns(), 1))
+
+    def off(self):
+        self.value = 0
+        self.edges.append((time.perf_counter_ns(), 0))
+
+    def close(self):
+        pass
+
+    def widths_us(self):
+        """Length of each pulse so far, in microseconds."""
+        ons = [t for t, v in self.edges if v == 1]
+        offs = [t for t, v in self.edges if v == 0]
+        return [(off - on) / 1000.0 for on, off in zip(ons, offs)]
+
+
+def make_pulser(pin, fallback=None):
+    """
+    Best pulser for this pin: lgpio, then pigpio, then spin-waited software
+    on `fallback()` (which should make an on()/off() device, e.g. a gpiozero
+    DigitalOutputDevice). Raises if none of them work.
+    """
+    for kind in (LgpioPulser, PigpioPulser):
+        try:
+            return kind(pin)
+        except Exception:
+            pass
+    if fallback is None:
+        raise RuntimeError(f"no way to drive GPIO {pin}")
+    return SoftwarePulser(fallback())
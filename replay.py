@@ -0,0 +1,291 @@
+#!/home/murray/env/bin/python3
+#  Copyright 2026 Nolan Stokely <nolan@stokely.org>
+"""
+Work out old recordings again, without doing the experiment again.
+
+Made the echo finder better? Run it over everything you recorded before:
+
+    python replay.py shots/ --output again.csv
+    python replay.py day1.npy one_shot.wav --sample-rate 44100 --envelope rectify
+
+Sources can be a shot archive folder (see shotarchive.py), a .npy file (one
+shot per row, or a single shot) or a .wav file (one shot). The shots are
+cut into chunks of --chunk shots, and the chunks are shared out between
+all the computer's cores (a ProcessPoolExecutor). Each chunk goes through
+echo_times_ms in one go, like a batch in the GUI. A whole day of shots takes
+seconds.
+
+For archives, each shot is worked out with the settings it was recorded
+with (see shotarchive.shot_settings): the excitation (and buzzer length,
+pitch and chip length), echo finder settings, tube length and time zero,
+unless the options say otherwise, and the old echo time is written next
+to the new one. So with no options, the new echo times only differ from
+the old ones if the echo finder itself has changed. The calibrated delay the apps took off (see
+calibration.py) is taken off again, so the two can be compared;
+--no-calibration leaves it on.
+
+.npy and .wav files don't say when the beep was. Give --beep-index (the
+sample where the beep starts, e.g. 88 for 2 ms of pre-beep at 44100 Hz) or
+--time-from direct (count from the buzzer sound heard in the recording),
+or the times count from the start of the recording.
+"""
+import argparse
+import os
+import sys
+import time
+import wave
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from echofinder import echo_times_ms, speed_m_per_s
+from excitation import make_excitation
+from scifair import ResultWriter
+from shotarchive import ShotArchive
+
+FIELDS = ["source", "shot", "time", "beep_index", "old_echo_ms", "echo_ms", "speed_m_per_s"]
+CHUNK_SHOTS = 256
+DEFAULT_DISTANCE_M = 3.0
+
+
+def read_wav(path):
+    """(samples as float32 from -1 to 1, sample rate) of a .wav file's first channel."""
+    with wave.open(path, "rb") as f:
+        width = f.getsampwidth()
+        channels = f.getnchannels()
+        sample_rate = f.getframerate()
+        raw = f.readframes(f.getnframes())
+    if width == 1:
+        x = (np.frombuffer(raw, np.uint8).astype(np.float32) - 128) / 128
+    elif width == 2:
+        x = np.frombuffer(raw, "<i2").astype(np.float32) / 32768
+    elif width == 4:
+        x = np.frombuffer(raw, "<i4").astype(np.float32) / 2147483648
+    else:
+        raise ValueError(f"{path}: can't read {8 * width}-bit samples")
+    return x.reshape(-1, channels)[:, 0], sample_rate
+
+
+# Built once per worker process, not once per chunk
+_filters = {}
+
+
+def _excitation(how, sample_rate):
+    # how = (name, beep_ms, freq_hz, chip_us); None means make_excitation's default
+    key = (how, sample_rate)
+    if key not in _filters:
+        name, beep_ms, freq_hz, chip_us = how
+        tuned = {k: v for k, v in (("beep_ms", beep_ms), ("freq_hz", freq_hz), ("chip_us", chip_us)) if v is not None}
+        excitation = make_excitation(name, **tuned)
+        _filters[key] = (excitation, excitation.matched_filter(sample_rate))
+    return _filters[key]
+
+
+def _load(unit):
+    if unit["kind"] == "archive":
+        return ShotArchive(unit["path"], mode="r").waves(unit["shots"])
+    if unit["kind"] == "npy":
+        waves = np.load(unit["path"], mmap_mode="r")
+        return waves[None, :] if waves.ndim == 1 else waves[unit["shots"]]
+    return unit["waves"]
+
+
+def analyze_chunk(unit):
+    """
+    Work out one chunk of shots (runs in a worker process). Returns
+    (echo_ms, speed_m_per_s) arrays, one entry per shot.
+    """
+    excitation, mf = _excitation(unit["excitation"], unit["sample_rate"])
+    echo_ms = echo_times_ms(
+        _load(unit),
+        unit["sample_rate"],
+        unit["beep_indexes"],
+        pulse_ms=excitation.blank_ms,
+        pulse_freq_hz=excitation.freq_hz,
+        matched_filter=mf,
+        detector=unit["detector"],
+        refine=unit["refine"],
+        time_from=unit["time_from"],
+        cfar_margin_db=unit["cfar_db"],
+        search_end_ms=None if unit["cfar_db"] is not None else unit["search_end_ms"],
+        envelope=unit["envelope"],
+    )
+    echo_ms = echo_ms - unit["calibration_ms"]
+    speeds = np.array([speed_m_per_s(t, unit["distance_m"]) for t in echo_ms])
+    return echo_ms, speeds
+
+
+def _how(opts, settings):
+    """(name, beep_ms, freq_hz, chip_us) for _excitation: the options, else the archived settings."""
+    if opts.excitation is not None:
+        return (opts.excitation, opts.beep_ms, opts.freq_hz, opts.chip_us)
+    return (settings.get("excitation", "beep"),
+            opts.beep_ms or settings.get("beep_ms"),
+            opts.freq_hz or settings.get("freq_hz"),
+            opts.chip_us or settings.get("chip_us"))
+
+
+def _finder(opts, settings):
+    """detector, refine, envelope and cfar_db for echo_times_ms: the options, else the archived settings."""
+    if opts.cfar_db is None:
+        cfar_db = settings.get("cfar_db")
+    else:
+        cfar_db = None if opts.cfar_db == "off" else float(opts.cfar_db)
+    return {"detector": opts.detector or settings.get("detector", "matched"),
+            "refine": opts.refine or settings.get("refine", "parabolic"),
+            "envelope": opts.envelope or settings.get("envelope", "hilbert"),
+            "cfar_db": cfar_db}
+
+
+def _chunks(shots, size):
+    for i in range(0, len(shots), size):
+        yield shots[i:i + size]
+
+
+def plan(sources, opts):
+    """
+    Cut every source into work units for analyze_chunk. Each unit also
+    carries the rows of the results table it will fill in (everything but
+    the new echo time and speed).
+    """
+    units = []
+    common = {"search_end_ms": opts.search_end_ms}
+    for path in sources:
+        if os.path.isdir(path):
+            archive = ShotArchive(path, mode="r")
+            index = archive.index
+            # Shots taken with the same settings can share a chunk
+            groups = {}
+            for k, settings_id in enumerate(index["settings"]):
+                groups.setdefault(int(settings_id), []).append(k)
+            for settings_id, shots in sorted(groups.items()):
+                settings = archive.settings()[settings_id]
+                for chunk in _chunks(np.array(shots), opts.chunk):
+                    rec = index[chunk]
+                    units.append(dict(
+                        common, **_finder(opts, settings), kind="archive", path=path, shots=chunk, sample_rate=archive.sample_rate,
+                        beep_indexes=rec["beep_index"].tolist(),
+                        excitation=_how(opts, settings),
+                        time_from=opts.time_from or settings.get("time_from", "beep"),
+                        distance_m=opts.distance or settings.get("distance_m", DEFAULT_DISTANCE_M),
+                        calibration_ms=0.0 if opts.no_calibration else settings.get("calibration_ms", 0.0),
+                        rows=[{"source": path, "shot": int(k), "time": float(r["time"]),
+                               "beep_index": float(r["beep_index"]), "old_echo_ms": float(r["echo_ms"])}
+                              for k, r in zip(chunk, rec)],
+                    ))
+            continue
+
+        if path.endswith(".npy"):
+            if opts.sample_rate is None:
+                raise ValueError(f"{path}: say what --sample-rate it was recorded at")
+            waves = np.load(path, mmap_mode="r")
+            n_shots = len(waves) if waves.ndim == 2 else 1
+            unit = dict(common, kind="npy", path=path, sample_rate=opts.sample_rate)
+            shot_lists = list(_chunks(np.arange(n_shots), opts.chunk))
+        elif path.endswith(".wav"):
+            x, sample_rate = read_wav(path)
+            unit = dict(common, kind="wav", path=path, sample_rate=sample_rate, waves=x[None, :])
+            shot_lists = [np.arange(1)]
+        else:
+            raise ValueError(f"{path}: not a shot archive, .npy or .wav")
+        if opts.beep_index is None and opts.time_from != "direct":
+            print(f"replay: {path} doesn't say when the beep was, so times count from the start of the recording"
+                  " (see --beep-index and --time-from)", file=sys.stderr)
+        for chunk in shot_lists:
+            units.append(dict(
+                unit, **_finder(opts, {}), shots=chunk, beep_indexes=None if opts.beep_index is None else [opts.beep_index] * len(chunk),
+                excitation=_how(opts, {}), time_from=opts.time_from or "beep",
+                distance_m=opts.distance or DEFAULT_DISTANCE_M, calibration_ms=0.0,
+                rows=[{"source": path, "shot": int(k), "time": None, "beep_index": opts.beep_index,
+                       "old_echo_ms": None} for k in chunk],
+            ))
+    return units
+
+
+def _rounded(x, digits):
+    return round(float(x), digits) if x is not None and np.isfinite(x) else None
+
+
+def replay(units, workers=None):
+    """Run every unit, in parallel, and return the results table (a list of dicts) in order."""
+    work = [{k: v for k, v in u.items() if k != "rows"} for u in units]
+    if workers == 1 or len(work) <= 1:
+        results = map(analyze_chunk, work)
+        return _table(units, results)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return _table(units, pool.map(analyze_chunk, work))
+
+
+def _table(units, results):
+    table = []
+    for unit, (echo_ms, speeds) in zip(units, results):
+        for row, t, speed in zip(unit["rows"], echo_ms, speeds):
+            table.append(dict(row, echo_ms=t, speed_m_per_s=speed))
+    return table
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(description="Find the echoes in old recordings again.")
+    parser.add_argument("sources", nargs="+", help="shot archive folders, .npy or .wav files")
+    parser.add_argument("--output", default="-", help="where to write results (default: stdout)")
+    parser.add_argument("--format", choices=["jsonl", "csv"], help="result format (default: from --output, else jsonl)")
+    parser.add_argument("--sample-rate", type=int, help="sample rate of .npy files")
+    parser.add_argument("--excitation", help="what was sent (default: what the archive says, else beep)")
+    parser.add_argument("--beep-ms", type=float, help="how long the buzzer was on (default: what the archive says, else 8)")
+    parser.add_argument("--freq-hz", type=float, help="the buzzer's pitch (default: what the archive says, else 2700)")
+    parser.add_argument("--chip-us", type=float, help="buzzer code chip length (default: what the archive says, else 1000)")
+    parser.add_argument("--beep-index", type=float, help=".npy/.wav: sample where the beep starts in every shot")
+    parser.add_argument("--time-from", choices=["beep", "direct"],
+                        help="count from the beep or the buzzer sound heard directly (default: what the archive says, else beep)")
+    parser.add_argument("--distance", type=float, help="one-way tube length in m (default: what the archive says, else 3)")
+    parser.add_argument("--no-calibration", action="store_true",
+                        help="don't take off the calibrated delay the archive's shots had taken off")
+    parser.add_argument("--cfar-db", help="see scifair.py, or \"off\" (default: what the archive says, else off)")
+    parser.add_argument("--search-end-ms", type=float, default=35, help="without CFAR, look for the echo this soon")
+    parser.add_argument("--envelope", choices=["hilbert", "rectify", "none"],
+                        help="(default: what the archive says, else hilbert)")
+    parser.add_argument("--detector", choices=["matched", "loudest"], help="(default: what the archive says, else matched)")
+    parser.add_argument("--refine", choices=["none", "parabolic", "gaussian", "sinc"],
+                        help="(default: what the archive says, else parabolic)")
+    parser.add_argument("--chunk", type=int, default=CHUNK_SHOTS, help="shots per work unit (default %(default)s)")
+    parser.add_argument("--workers", type=int, help="processes to use (default: one per core)")
+    opts = parser.parse_args(args)
+    if opts.cfar_db not in (None, "off"):
+        try:
+            float(opts.cfar_db)
+        except ValueError:
+            parser.error(f"--cfar-db: not a number or \"off\": {opts.cfar_db!r}")
+    if opts.format is None:
+        opts.format = "csv" if opts.output.endswith(".csv") else "jsonl"
+    return opts
+
+
+def main(args):
+    opts = parse_args(args)
+    t = time.perf_counter()
+    try:
+        units = plan(opts.sources, opts)
+    except (ValueError, FileNotFoundError) as e:
+        print(f"replay: {e}", file=sys.stderr)
+        return 2
+    table = replay(units, opts.workers)
+    writer = ResultWriter(opts.output, opts.format, FIELDS)
+    try:
+        for row in table:
+            writer.write({
+                "source": row["source"],
+                "shot": row["shot"],
+                "time": row["time"],
+                "beep_index": _rounded(row["beep_index"], 3),
+                "old_echo_ms": _rounded(row["old_echo_ms"], 4),
+                "echo_ms": _rounded(row["echo_ms"], 4),
+                "speed_m_per_s": _rounded(row["speed_m_per_s"], 3),
+            })
+    finally:
+        writer.close()
+    print(f"{len(table)} shots in {time.perf_counter() - t:.1f} s", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
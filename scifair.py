@@ -1,59 +1,260 @@
 #!/home/murray/env/bin/python3
 #  Copyright 2026 Nolan Stokely <nolan@stokely.org>
 
+import argparse
+import csv
+import json
 import sys
 import time
-import gpiozero
-from gpiozero import Buzzer
-import sounddevice as sd
 import numpy as np
-import matplotlib.pyplot as plt
+
+from airspeed import AirSensor, echo_window_ms, speed_of_sound
+from audiocapture import RingRecorder
+from averaging import CoherentAverage
+from backends import HardwareBackend, SimulatedBackend, Tube
+from calibration import device_key, load_profile, matches
+from echofinder import echo_times_ms, find_echoes, fit_echo_train, speed_m_per_s
+from excitation import make_excitation
+from shotarchive import ShotArchive, shot_settings
+from wavedisplay import DecimatedLine
+# gpiozero, sounddevice and matplotlib are slow to load, so we only import
+# them when we need them (python importbudget.py scifair to check)
 SAMPLE_RATE=44100
-DURATION=0.05 #seconds
 DEVICE=1
+BUZZER_PIN=21
+BEEP_MS=8 # how long the buzzer is on for each shot
+BUZZER_FREQ_HZ=2700 # the buzzer's pitch
+PRE_BEEP_MS=2 # keep this much sound from before the beep
+RECORD_MS=40 # and this much after (longer catches more round trips)
+TUBE_DISTANCE_M=3.0
+CFAR_DB=None # e.g. 10: an echo must be this much louder than the noise around it, or the shot is thrown out
+ECHO_SEARCH_END_MS=35 # without CFAR, only look for the echo this soon after the beep
+BEEP_GAP_S=0.05 # with --average, wait this long between beeps so the tube goes quiet
+AIR_SENSOR_EVERY_S=30 # with --air-sensor, read it this often (a 1-Wire reading takes most of a second)
 
+FIELDS=["shot", "time", "beep_index", "echo_ms", "speed_m_per_s", "max_amplitude", "averaged", "snr_db",
+        "echo_count", "train_speed_m_per_s", "train_latency_ms", "temp_c", "expected_speed_m_per_s",
+        "calibration_ms"]
 
 
-def main(args):
-    print("hello buster")
-    #time.sleep(5)
-    #print("i'm sleepy")
-    print("Sound devices")
-    print(sd.query_devices())
-    audio=sd.rec(
-        int(SAMPLE_RATE * DURATION),
-        samplerate=SAMPLE_RATE,
-        channels=1,
-        dtype="float32",
-        device=DEVICE,
-        )
-
-    print("GPIO Debug")
-    print(gpiozero.__file__)
-    buzzer=Buzzer(21, active_high=True, initial_value=False)
-    
-    sd.wait()
-    buzzer.on()
-    #time.sleep(0.01)
-    time.sleep(.05)
-    buzzer.off()
-    buzzer.close()
-    
-    x=audio.flatten()
-    t=np.arange(len(x))/SAMPLE_RATE
-    print(f"done. max abs amplitude : {np.max(np.abs(x)):.3f}")
-    
-    # now we plot the sound wave
-    plt.figure()
-    plt.plot(t,x)
+def parse_args(args):
+    parser=argparse.ArgumentParser(description="Beep, record the echo and work out the speed of sound.")
+    parser.add_argument("--count", type=int, default=1, help="how many shots to take (0 = until Ctrl-C)")
+    parser.add_argument("--interval", type=float, default=0.5, help="seconds between shots")
+    parser.add_argument("--output", default="-", help="where to write results (default: stdout)")
+    parser.add_argument("--format", choices=["jsonl", "csv"], help="result format (default: from --output, else jsonl)")
+    parser.add_argument("--no-plot", action="store_true", help="don't show the waveform (no matplotlib needed)")
+    parser.add_argument("--simulate", action="store_true", help="use a pretend microphone and buzzer (no Pi needed)")
+    parser.add_argument("--excitation", default="beep",
+                        help="what to send: beep, barker13, mls4 (buzzer codes), chirp or expchirp (speaker), see excitation.py")
+    parser.add_argument("--average", type=int, default=1,
+                        help="line up and average this many beeps into each shot (cleaner echo in a noisy room)")
+    parser.add_argument("--cfar-db", type=float, default=CFAR_DB,
+                        help="throw a shot out unless its echo is this much louder (dB) than the noise around it "
+                             "(default: off, take the biggest peak; works with beep and chirp, not buzzer codes)")
+    parser.add_argument("--envelope", choices=["hilbert", "rectify", "none"], default="hilbert",
+                        help="find the echo on the smooth outline of the signal (default %(default)s)")
+    parser.add_argument("--impulse-response", metavar="FILE.npy",
+                        help="also save each shot's impulse response (deconvolved, one row per shot)")
+    parser.add_argument("--archive", metavar="DIR",
+                        help="also keep every shot's sound in this folder (see shotarchive.py)")
+    parser.add_argument("--temp", type=float, metavar="C",
+                        help="air temperature, to only look for the echo where it should be (see airspeed.py)")
+    parser.add_argument("--humidity", type=float, metavar="PCT", help="air humidity in %%")
+    parser.add_argument("--air-sensor", metavar="FILE",
+                        help="read the temperature from a sensor file every AIR_SENSOR_EVERY_S (\"auto\" finds one)")
+    parser.add_argument("--no-calibration", action="store_true",
+                        help="don't take the calibrated delay off the echo time (see calibration.py)")
+    parser.add_argument("--speaker", action="store_true",
+                        help="play the sound through the sound card instead of the buzzer (same clock as the microphone)")
+    opts=parser.parse_args(args)
+    opts.excitation_name=opts.excitation
+    try:
+        opts.excitation=make_excitation(opts.excitation, beep_ms=BEEP_MS, freq_hz=BUZZER_FREQ_HZ)
+    except ValueError as e:
+        parser.error(str(e))
+    if opts.format is None:
+        opts.format="csv" if opts.output.endswith(".csv") else "jsonl"
+    return opts
+
+
+class ResultWriter:
+    """Writes one line per shot as JSON lines or CSV, flushing as it goes."""
+
+    def __init__(self, path, fmt, fields=FIELDS):
+        self.file=sys.stdout if path == "-" else open(path, "w", newline="")
+        self.fmt=fmt
+        self.csv=None
+        if fmt == "csv":
+            self.csv=csv.DictWriter(self.file, fieldnames=fields)
+            self.csv.writeheader()
+
+    def write(self, row):
+        if self.csv is not None:
+            self.csv.writerow(row)
+        else:
+            self.file.write(json.dumps(row) + "\n")
+        self.file.flush()
+
+    def close(self):
+        if self.file is not sys.stdout:
+            self.file.close()
+
+
+def take_shot(recorder, buzzer, excitation, backend):
+    """Beep (or send a code) and return (wave, beep_index) with the start PRE_BEEP_MS in."""
+    # long codes need a longer recording so the echo of the whole code fits
+    extra_ms=max(0, excitation.length_ms - BEEP_MS)
+    if recorder.can_play:
+        # sound card plays and records on one clock, so this is exact
+        frame=recorder.play(excitation.sound(recorder.sample_rate))
+        return recorder.snapshot_at_frame(frame, PRE_BEEP_MS, RECORD_MS + extra_ms)
+    edge=excitation.send(buzzer, backend, recorder.sample_rate) # exact timing, see pulses.py
+    return recorder.snapshot_at_time(edge, PRE_BEEP_MS, RECORD_MS + extra_ms)
+
+
+def take_averaged_shot(recorder, buzzer, excitation, backend, n, gap_s):
+    """Average n shots lined up on the direct sound. Returns (wave, beep_index, snr_db)."""
+    average=CoherentAverage(SAMPLE_RATE, pulse_freq_hz=excitation.freq_hz,
+                            matched_filter=excitation.matched_filter(SAMPLE_RATE))
+    for k in range(n):
+        if k > 0:
+            time.sleep(gap_s)
+        average.add(*take_shot(recorder, buzzer, excitation, backend))
+    snr_db=average.snr_db[-1][1] if average.snr_db else None
+    return average.mean(), average.beep_index, snr_db
+
+
+def plot_wave(x, beep_index):
+    # only load matplotlib when we actually draw something
+    import matplotlib.pyplot as plt
+    t=(np.arange(len(x)) - beep_index)/SAMPLE_RATE
+    fig, ax=plt.subplots()
+    line,=ax.plot([], [])
+    # draw one min/max pair per pixel, worked out again when you zoom or resize
+    view=DecimatedLine(ax, line)
+    view.set_data(t, x)
+    ax.set_xlim(t[0], t[-1])
+    ax.set_ylim(-1.1*np.max(np.abs(x)), 1.1*np.max(np.abs(x)))
+    fig.canvas.mpl_connect("resize_event", lambda event: view.update())
     plt.title("Nolan's amazing microphone waveform")
-    plt.xlabel("time (s)")
+    plt.xlabel("time since beep (s)")
     plt.ylabel("amplitude")
     plt.grid(True)
     plt.show()
+
+
+def main(args):
+    opts=parse_args(args)
+    if opts.simulate:
+        backend=SimulatedBackend(Tube(distance_m=TUBE_DISTANCE_M))
+    else:
+        backend=HardwareBackend()
+    if not opts.no_plot and not opts.simulate:
+        import gpiozero
+        import sounddevice as sd
+        # chatty stuff goes to stderr so stdout is just results
+        print("hello buster", file=sys.stderr)
+        #time.sleep(5)
+        #print("i'm sleepy")
+        print("Sound devices", file=sys.stderr)
+        print(sd.query_devices(), file=sys.stderr)
+        print("GPIO Debug", file=sys.stderr)
+        print(gpiozero.__file__, file=sys.stderr)
+
+    # the microphone keeps running, we just remember where each beep starts
+    recorder=RingRecorder(SAMPLE_RATE, device=DEVICE, backend=backend, duplex=opts.speaker).start()
+    if opts.speaker and not recorder.can_play:
+        print("no sound card output, using the buzzer", file=sys.stderr)
+    buzzer=backend.pulser(BUZZER_PIN)
+    # the fixed delay of this microphone and buzzer, measured by calibration.py
+    # (only if it was measured beeping the same way, see calibration.py)
+    calibration=None if opts.no_calibration else load_profile(device_key(backend, DEVICE))
+    beep_from="speaker" if recorder.can_play else "buzzer"
+    if calibration is not None and not matches(calibration, beep_from, opts.excitation_name):
+        print(f"not using the calibration: it was measured with the {calibration.get('beep_from', 'buzzer')} and "
+              f"{calibration.get('excitation', 'beep')}, not the {beep_from} and {opts.excitation_name}", file=sys.stderr)
+        calibration=None
+    offset_ms=0.0 if calibration is None else calibration["offset_ms"]
+    if calibration is not None:
+        print(f"taking {offset_ms:.3f} ms off every echo (calibration.py {calibration['method']})", file=sys.stderr)
+    writer=ResultWriter(opts.output, opts.format)
+    archive=ShotArchive(opts.archive, SAMPLE_RATE) if opts.archive else None
+    # saved once in the archive, every shot just points at it
+    sensor=None
+    if opts.air_sensor:
+        sensor=AirSensor(None if opts.air_sensor == "auto" else opts.air_sensor, every_s=AIR_SENSOR_EVERY_S)
+    settings=shot_settings(opts.excitation_name, BEEP_MS, BUZZER_FREQ_HZ,
+                           chip_us=getattr(opts.excitation, "chip_us", None), beep_from=beep_from,
+                           averaged=max(1, opts.average), envelope=opts.envelope, cfar_db=opts.cfar_db,
+                           distance_m=TUBE_DISTANCE_M, calibration_ms=offset_ms)
+    x=None
+    shot=0
+    responses=[]
+    try:
+        while opts.count == 0 or shot < opts.count:
+            if shot > 0:
+                time.sleep(opts.interval)
+            snr_db=None
+            if opts.average > 1:
+                x, beep_index, snr_db=take_averaged_shot(recorder, buzzer, opts.excitation, backend,
+                                                         opts.average, BEEP_GAP_S)
+            else:
+                x, beep_index=take_shot(recorder, buzzer, opts.excitation, backend)
+            mf=opts.excitation.matched_filter(SAMPLE_RATE)
+            temp_c, humidity=opts.temp, opts.humidity
+            if sensor is not None:
+                temp_c, sensor_humidity=sensor.latest()
+                if sensor_humidity is not None:
+                    humidity=sensor_humidity
+            window=None if temp_c is None else tuple(t + offset_ms for t in echo_window_ms(TUBE_DISTANCE_M, temp_c, humidity))
+            cfar_db=opts.cfar_db
+            echo_ms=float(echo_times_ms(x[None, :], SAMPLE_RATE, [beep_index], pulse_ms=opts.excitation.blank_ms,
+                                        matched_filter=mf, cfar_margin_db=cfar_db, envelope=opts.envelope,
+                                        search_end_ms=ECHO_SEARCH_END_MS if cfar_db is None else None,
+                                        search_window_ms=window)[0]) - offset_ms
+            # every round trip in the recording, and the speed from their spacing
+            echoes=find_echoes(x, SAMPLE_RATE, beep_index, pulse_ms=opts.excitation.blank_ms, matched_filter=mf,
+                               envelope=opts.envelope)
+            train=fit_echo_train(echoes, TUBE_DISTANCE_M)
+            speed=speed_m_per_s(echo_ms, TUBE_DISTANCE_M)
+            if archive is not None:
+                archive.append(x, beep_index, echo_ms, speed, settings)
+            if opts.impulse_response:
+                responses.append(mf.deconvolve(x).astype(np.float32))
+            writer.write({
+                "shot": shot,
+                "time": time.time(),
+                "beep_index": round(float(beep_index), 3),
+                # no echo stood out: null, so the shot can be skipped later
+                "echo_ms": round(echo_ms, 4) if np.isfinite(echo_ms) else None,
+                "speed_m_per_s": round(speed, 3) if np.isfinite(echo_ms) else None,
+                "max_amplitude": round(float(np.max(np.abs(x))), 4),
+                "averaged": max(1, opts.average),
+                "snr_db": None if snr_db is None or not np.isfinite(snr_db) else round(float(snr_db), 2),
+                "echo_count": len(echoes),
+                "train_speed_m_per_s": None if train is None else round(float(train["speed_m_per_s"]), 3),
+                "train_latency_ms": None if train is None else round(train["latency_ms"], 4),
+                "temp_c": temp_c,
+                "expected_speed_m_per_s": None if temp_c is None else round(speed_of_sound(temp_c, humidity), 3),
+                "calibration_ms": round(offset_ms, 4),
+            })
+            shot+=1
+    except KeyboardInterrupt:
+        pass
+    finally:
+        writer.close()
+        if archive is not None:
+            archive.close()
+        if responses:
+            np.save(opts.impulse_response, np.stack(responses))
+        buzzer.close()
+        recorder.close()
+
+    if x is not None and not opts.no_plot:
+        plot_wave(x, beep_index)
     return 0
 
 
 if __name__ == '__main__':
     sys.exit(main(sys.argv[1:]))
-
@@ -2,13 +2,25 @@
 import time
 import threading
 import numpy as np
-import sounddevice as sd
+
+from airspeed import AirSensor, echo_window_ms, speed_of_sound
+from audiocapture import RingRecorder
+from averaging import CoherentAverage
+from backends import HardwareBackend, SimulatedBackend, Tube
+from calibration import device_key, load_profile, matches
+from echofinder import echo_times_ms, find_echoes, fit_echo_train, speed_m_per_s
+from excitation import make_excitation
+from parallel import ParallelDetector
+from shotarchive import ShotArchive, shot_settings
+from sonar import SonarPipeline
+from wavedisplay import WavePlot
 
 import tkinter as tk
 from tkinter import ttk
 
-from matplotlib.figure import Figure
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+# matplotlib, sounddevice and gpiozero are slow to load (seconds on a Pi),
+# so they are only imported when first needed. That way the window shows
+# up right away. Check with: python importbudget.py scifairgui
 
 # -----------------------------
 # 1) KID-FRIENDLY SETTINGS
@@ -16,78 +28,426 @@ from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 
 GPIO_BUZZER_PIN = 18        # Change if your buzzer is on a different GPIO pin
 BUZZER_ON_MS = 8            # How long the buzzer beeps (milliseconds). Try 5 to 12.
+BUZZER_FREQ_HZ = 2700       # The buzzer's pitch. Most small buzzers are 2000 to 4000 Hz.
+EXCITATION = "beep"         # What to send: "beep", a buzzer code like "barker13" (louder, sharper echo)
+                            # or "chirp" (needs a speaker on the sound card). See excitation.py.
+BEEP_FROM = "buzzer"        # "buzzer" (GPIO) or "speaker" (sound card output, timed by the same
+                            # clock as the microphone, so exact). No speaker? It uses the buzzer.
 
 SAMPLE_RATE = 48000         # Audio samples per second. 48000 is common and good.
-RECORD_MS = 60              # Record this long after you press the button
-IGNORE_FIRST_MS = 2         # Ignore the first tiny bit (direct buzzer leak)
-ECHO_SEARCH_START_MS = 6    # Don’t look for echoes before this time
-ECHO_SEARCH_END_MS = 55     # Don’t look for echoes after this time
+DEVICE = None               # Microphone number from sd.query_devices() (None = default)
+RECORD_MS = 40              # Record this long after the beep starts
+PRE_BEEP_MS = 2             # Also keep this much sound from just before the beep
+ECHO_SEARCH_START_MS = 6    # Don’t look for echoes before this time (only used if we don't know when the beep was)
+ECHO_SEARCH_END_MS = 35     # Don’t look for echoes after this time (counted from the beep; only if ECHO_CFAR_DB is None)
+ECHO_CFAR_DB = None         # e.g. 10: only trust an echo this much louder (dB) than the noise around it;
+                            # shots without one are thrown out. None = biggest peak before ECHO_SEARCH_END_MS.
+                            # Works with "beep" and "chirp", but not buzzer codes (their echo sits
+                            # too close to the direct sound's tail).
+BATCH_SHOTS = 10            # How many shots the "x10" button takes in a row
+BATCH_GAP_MS = 100          # Wait this long between shots so the tube goes quiet
+PARALLEL_MIN_SHOTS = 64     # Batches this big are worked out on all the Pi's cores at once (see parallel.py)
+AVERAGE_SHOTS = 20          # How many shots the "AVERAGE" button adds together (noisy rooms)
+AVERAGE_ALIGN = "direct"    # Line shots up on the buzzer sound we hear ("direct") or the beep time ("beep")
+SONAR_GAP_MS = 20           # Sonar mode: extra quiet time after each recording before the next beep
+SONAR_REFRESH_MS = 30       # Sonar mode: how often the screen looks for a new shot to draw
+
+ECHO_DETECTOR = "matched"   # "matched" (compare with the buzzer sound) or "loudest" (biggest sample)
+PEAK_REFINE = "parabolic"   # Find the peak between samples: "none", "parabolic", "gaussian" or "sinc"
+ECHO_ENVELOPE = "hilbert"   # Find the peak of the smooth outline, not the wiggles: "hilbert", "rectify" or "none"
+TIME_FROM = "beep"          # Echo time starts at: "beep" (when we switched the buzzer on)
+                            # or "direct" (when the microphone first hears the buzzer)
 
 TUBE_DISTANCE_M = 3.0       # One-way distance to reflecting end (meters). Change for your tube.
 # If you're using a 10 ft tube, 10 ft = 3.05 m (roughly). Put your best estimate here.
 
+AIR_TEMP_C = None           # Room temperature (C), e.g. 21. Then we know roughly when the echo
+                            # should come back, and only look for it there (see airspeed.py).
+AIR_HUMIDITY_PCT = None     # Humidity (%), if you know it
+AIR_SENSOR = None           # Or read them from a sensor: "auto" finds a 1-Wire or I2C one,
+                            # or give the path of its file. Used instead of AIR_TEMP_C.
+AIR_SENSOR_EVERY_S = 30     # Read the sensor this often (a 1-Wire reading takes almost a second)
+USE_CALIBRATION = True      # Take off the buzzer and microphone's own delay, if calibration.py
+                            # has measured it for this microphone (only when TIME_FROM is "beep")
+AIR_TEMP_ERROR_C = 3        # How far off the temperature might be; a bigger number looks wider
+
+ARCHIVE_DIR = None          # A folder name like "shots" keeps every shot's sound there (see shotarchive.py)
+
+SIMULATE = False            # True = pretend microphone and buzzer (try it without the Pi!)
+
 # -----------------------------
 # 2) BUZZER SETUP (SAFE FALLBACK)
 # -----------------------------
-try:
-    from gpiozero import DigitalOutputDevice
-    buzzer = DigitalOutputDevice(GPIO_BUZZER_PIN)
-    HAVE_BUZZER = True
-except Exception:
-    # This lets you run the GUI on a laptop too (no buzzer).
-    buzzer = None
-    HAVE_BUZZER = False
+_backend = None
+
+
+def get_backend():
+    """The real microphone and buzzer, or pretend ones if SIMULATE is True (see backends.py)."""
+    global _backend
+    if _backend is None:
+        if SIMULATE:
+            _backend = SimulatedBackend(Tube(distance_m=TUBE_DISTANCE_M, freq_hz=BUZZER_FREQ_HZ))
+        else:
+            _backend = HardwareBackend()
+    return _backend
+
+
+# The buzzer is set up the first time we need it. It's a "pulser" that
+# times each beep exactly (see pulses.py).
+buzzer = None
+HAVE_BUZZER = None          # None = haven't looked yet
+_buzzer_lock = threading.Lock()
+
+
+def get_buzzer():
+    """Open the GPIO buzzer the first time we're called. Returns None if there isn't one."""
+    global buzzer, HAVE_BUZZER
+    with _buzzer_lock:
+        if HAVE_BUZZER is None:
+            try:
+                buzzer = get_backend().pulser(GPIO_BUZZER_PIN)
+                HAVE_BUZZER = True
+            except Exception:
+                # This lets you run the GUI on a laptop too (no buzzer).
+                buzzer = None
+                HAVE_BUZZER = False
+    return buzzer
+
+
+_excitation = None
+
+
+def get_excitation():
+    """The EXCITATION sound, with the matched filter that finds it."""
+    global _excitation
+    if _excitation is None:
+        _excitation = make_excitation(EXCITATION, beep_ms=BUZZER_ON_MS, freq_hz=BUZZER_FREQ_HZ)
+    return _excitation
 
 
 def beep():
-    """Turn buzzer on for BUZZER_ON_MS milliseconds."""
-    if not HAVE_BUZZER:
-        return
-    buzzer.on()
-    time.sleep(BUZZER_ON_MS / 1000.0)
-    buzzer.off()
+    """
+    Turn buzzer on for BUZZER_ON_MS milliseconds (or send the EXCITATION code).
+    Returns the time.perf_counter_ns() when the sound started
+    (or None if there is no buzzer).
+    """
+    excitation = get_excitation()
+    buzzer = None
+    if excitation.kind == "gpio":
+        buzzer = get_buzzer()
+        if buzzer is None:
+            return None
+    return excitation.send(buzzer, get_backend(), SAMPLE_RATE)
+
+
+def shot_ms():
+    """How much to record after the beep: RECORD_MS, plus extra for long codes."""
+    return RECORD_MS + max(0, get_excitation().length_ms - BUZZER_ON_MS)
 
 
 # -----------------------------
 # 3) AUDIO + ECHO FINDING
 # -----------------------------
 
-def record_audio():
-    """Record RECORD_MS of audio from the default microphone."""
-    seconds = RECORD_MS / 1000.0
-    audio = sd.rec(int(seconds * SAMPLE_RATE), samplerate=SAMPLE_RATE, channels=1, dtype="float32")
-    sd.wait()
-    return audio[:, 0]  # make it 1D
+# The microphone stays open the whole time (see audiocapture.py).
+_recorder = None
+_recorder_lock = threading.Lock()
+
+
+def get_recorder():
+    """Start the always-on microphone the first time it is needed."""
+    global _recorder
+    with _recorder_lock:
+        if _recorder is None:
+            _recorder = RingRecorder(SAMPLE_RATE, device=DEVICE, backend=get_backend(),
+                                     duplex=(BEEP_FROM == "speaker")).start()
+    return _recorder
+
+
+def record_shot():
+    """
+    Beep and return (wave, beep_index): PRE_BEEP_MS + shot_ms() of sound
+    around the beep and the sample (can be fractional) where the buzzer
+    switched on. beep_index is None if there is no buzzer to time.
+    """
+    rec = get_recorder()
+    if rec.can_play:
+        # Played and recorded by the sound card in one go, so we know the
+        # exact sample where the sound went out.
+        frame = rec.play(get_excitation().sound(SAMPLE_RATE))
+        return rec.snapshot_at_frame(frame, PRE_BEEP_MS, shot_ms())
+
+    start = rec.frames_written + rec.ms_to_frames(PRE_BEEP_MS)
+    beep_ns = beep()
+
+    if beep_ns is None:
+        # No buzzer, so we don't know exactly when the "beep" was.
+        return rec.snapshot_around(start, PRE_BEEP_MS, shot_ms()), None
+
+    # Cut the recording around the microphone sample heard at the beep.
+    return rec.snapshot_at_time(beep_ns, PRE_BEEP_MS, shot_ms())
+
+
+def record_batch(n_shots, gap_ms=BATCH_GAP_MS):
+    """
+    Take n_shots shots back to back. Returns (waves, beep_indexes) where
+    waves has one recording per row.
+    """
+    n = get_recorder().ms_to_frames(PRE_BEEP_MS) + get_recorder().ms_to_frames(shot_ms())
+    waves = np.zeros((n_shots, n), dtype=np.float32)
+    beep_indexes = []
+    for k in range(n_shots):
+        if k > 0:
+            time.sleep(gap_ms / 1000.0)
+        wave, beep_index = record_shot()
+        waves[k] = wave
+        beep_indexes.append(beep_index)
+    return waves, beep_indexes
+
+
+def measure_batch(n_shots=BATCH_SHOTS, gap_ms=BATCH_GAP_MS):
+    """
+    Take n_shots shots and work them all out together (no GUI needed).
+    Returns a dict with the raw waves, each shot's echo time and speed,
+    and summaries of both (see summarize()).
+    """
+    waves, beep_indexes = record_batch(n_shots, gap_ms)
+    if n_shots >= PARALLEL_MIN_SHOTS:
+        results = get_parallel_detector().detect(waves, beep_indexes, search_window_ms=echo_window())
+        echo_ms = results["echo_ms"] - calibration_ms()
+    else:
+        echo_ms = find_echo_times_ms(waves, beep_indexes)
+    speeds = np.array([compute_speed_m_per_s(t) for t in echo_ms])
+    for wave, beep_index, t, speed in zip(waves, beep_indexes, echo_ms, speeds):
+        archive_shot(wave, beep_index, t, speed)
+    return {
+        "waves": waves,
+        "beep_indexes": beep_indexes,
+        "echo_ms": echo_ms,
+        "speed": speeds,
+        "echo_stats": summarize(echo_ms),
+        "speed_stats": summarize(speeds),
+        "air": get_air(),
+    }
+
+
+def measure_averaged(n_shots=AVERAGE_SHOTS, gap_ms=BATCH_GAP_MS):
+    """
+    Take n_shots shots, line them up and average them into one clean shot
+    (see averaging.py), then find the echo in that. Only the running sums
+    are kept, not every shot. Returns a dict with the averaged wave, its
+    echo time and speed, and "snr_db": how clean it got after each shot.
+    """
+    excitation = get_excitation()
+    average = CoherentAverage(SAMPLE_RATE, AVERAGE_ALIGN, pulse_freq_hz=excitation.freq_hz,
+                              matched_filter=excitation.matched_filter(SAMPLE_RATE))
+    for k in range(n_shots):
+        if k > 0:
+            time.sleep(gap_ms / 1000.0)
+        average.add(*record_shot())
+    if average.n == 0:
+        raise RuntimeError("no shots could be lined up (no buzzer?)")
+    wave = average.mean()
+    echo_ms = find_echo_time_ms(wave, average.beep_index)
+    archive_shot(wave, average.beep_index, echo_ms, compute_speed_m_per_s(echo_ms), averaged=average.n)
+    return {
+        "wave": wave,
+        "beep_index": average.beep_index,
+        "n": average.n,
+        "echo_ms": echo_ms,
+        "speed": compute_speed_m_per_s(echo_ms),
+        "snr_db": average.snr_db,
+        "air": get_air(),
+    }
+
+
+def detect_shot(wave, beep_index=None):
+    """Work out one shot: returns {"echo_ms": ..., "speed": ...}."""
+    echo_ms = find_echo_time_ms(wave, beep_index)
+    speed = compute_speed_m_per_s(echo_ms)
+    archive_shot(wave, beep_index, echo_ms, speed)
+    return {"echo_ms": echo_ms, "speed": speed}
+
+
+def make_sonar():
+    """
+    Continuous measuring: recording, echo finding and drawing overlap
+    (see sonar.py). Call .start() on it, then .latest() for new shots.
+    """
+    return SonarPipeline(record_shot, detect_shot, gap_ms=SONAR_GAP_MS)
 
 
-def find_echo_time_ms(wave):
+def find_echo_time_ms(wave, beep_index=None):
     """
-    Very simple echo finder:
-    - Use absolute value (loudness)
+    Echo finder:
+    - Slide a copy of the buzzer sound along the recording (matched filter)
+      and score how well it lines up, or just use loudness if ECHO_DETECTOR
+      is "loudest"
     - Ignore the start (direct buzzer)
+    - Smooth the score into an outline (ECHO_ENVELOPE), so the peak can't
+      jump between cycles of the buzzer tone
     - Find the biggest peak in a time window
+    - Polish the peak position to a fraction of a sample (PEAK_REFINE)
+    - With ECHO_CFAR_DB, only accept a peak that stands out from the noise
+      around it, and return NaN (no echo) otherwise
+
+    If beep_index (the sample where the beep started) is given, the echo
+    time is measured from the beep, and we only skip the beep itself.
+    If TIME_FROM is "direct", we instead look for where the buzzer sound
+    first shows up in the recording and measure from there. Otherwise it is
+    measured from the start of the recording.
+    """
+    return float(find_echo_times_ms(np.asarray(wave)[None, :], [beep_index])[0])
+
+
+def find_echo_times_ms(waves, beep_indexes=None):
+    """
+    Same as find_echo_time_ms, but for many recordings at once: waves has
+    one recording per row, and all rows are searched together with one big
+    FFT and one argmax. beep_indexes can have None for unknown beeps.
+    """
+    return echo_times_ms(waves, SAMPLE_RATE, beep_indexes, **echo_settings()) - calibration_ms()
+
+
+def echo_settings():
+    """The echo finder settings, as arguments for echo_times_ms."""
+    excitation = get_excitation()
+    return {
+        "pulse_ms": excitation.blank_ms,
+        "pulse_freq_hz": BUZZER_FREQ_HZ,
+        "detector": ECHO_DETECTOR,
+        "refine": PEAK_REFINE,
+        "envelope": ECHO_ENVELOPE,
+        "time_from": TIME_FROM,
+        "search_start_ms": ECHO_SEARCH_START_MS,
+        "search_end_ms": ECHO_SEARCH_END_MS if ECHO_CFAR_DB is None else None,
+        "matched_filter": excitation.matched_filter(SAMPLE_RATE),
+        "cfar_margin_db": ECHO_CFAR_DB,
+        "search_window_ms": echo_window(),
+    }
+
+
+# Worker processes for big batches, started the first time they're needed
+_parallel = None
+
+
+def get_parallel_detector():
+    global _parallel
+    if _parallel is None:
+        _parallel = ParallelDetector(SAMPLE_RATE, TUBE_DISTANCE_M, **echo_settings())
+    return _parallel
+
+
+def find_all_echoes(wave, beep_index=None):
+    """
+    Every echo that stands out (round trips 1, 2, 3...), not just the
+    biggest, with the same settings as find_echo_time_ms. See find_echoes.
+    """
+    excitation = get_excitation()
+    return find_echoes(
+        wave,
+        SAMPLE_RATE,
+        beep_index,
+        pulse_ms=excitation.blank_ms,
+        matched_filter=excitation.matched_filter(SAMPLE_RATE),
+        detector=ECHO_DETECTOR,
+        refine=PEAK_REFINE,
+        envelope=ECHO_ENVELOPE,
+        search_start_ms=ECHO_SEARCH_START_MS,
+    )
+
+
+def echo_train(wave, beep_index=None):
+    """
+    Speed from the spacing of all the echoes in one shot (see fit_echo_train),
+    or None if there aren't at least two round trips in the recording.
+    Record longer (RECORD_MS) to catch more of them.
     """
-    loud = np.abs(wave)
+    return fit_echo_train(find_all_echoes(wave, beep_index), TUBE_DISTANCE_M)
 
-    def ms_to_index(ms):
-        return int((ms / 1000.0) * SAMPLE_RATE)
 
-    i0 = ms_to_index(IGNORE_FIRST_MS)
-    i1 = ms_to_index(ECHO_SEARCH_START_MS)
-    i2 = ms_to_index(ECHO_SEARCH_END_MS)
+# Every shot is kept in ARCHIVE_DIR, if it is set (see shotarchive.py).
+_archive = None
+_archive_lock = threading.Lock()
 
-    # Safety clamps
-    i0 = max(0, min(i0, len(loud)))
-    i1 = max(0, min(i1, len(loud)))
-    i2 = max(0, min(i2, len(loud)))
 
-    # Zero out the part we don't want to consider
-    loud[:i1] = 0.0
-    loud[i2:] = 0.0
+def get_archive():
+    """Open ARCHIVE_DIR the first time it is needed. None if ARCHIVE_DIR is None."""
+    global _archive
+    if ARCHIVE_DIR is None:
+        return None
+    with _archive_lock:
+        if _archive is None:
+            _archive = ShotArchive(ARCHIVE_DIR, SAMPLE_RATE)
+    return _archive
 
-    peak_index = int(np.argmax(loud))
-    peak_ms = (peak_index / SAMPLE_RATE) * 1000.0
-    return peak_ms
+
+def archive_shot(wave, beep_index, echo_ms, speed, averaged=1):
+    """Keep the shot in ARCHIVE_DIR, with the settings it was taken with."""
+    archive = get_archive()
+    if archive is None:
+        return
+    settings = shot_settings(
+        EXCITATION, BUZZER_ON_MS, BUZZER_FREQ_HZ, chip_us=getattr(get_excitation(), "chip_us", None),
+        beep_from="speaker" if get_recorder().can_play else "buzzer", averaged=averaged,
+        detector=ECHO_DETECTOR, refine=PEAK_REFINE, envelope=ECHO_ENVELOPE, cfar_db=ECHO_CFAR_DB,
+        time_from=TIME_FROM, distance_m=TUBE_DISTANCE_M, calibration_ms=calibration_ms(),
+    )
+    archive.append(wave, beep_index, echo_ms, speed, settings)
+
+
+_air = {"sensor": None}
+_air_lock = threading.Lock()
+
+
+def get_air():
+    """
+    (temp_c, humidity_pct) of the air from AIR_SENSOR (read at most every
+    AIR_SENSOR_EVERY_S) or AIR_TEMP_C, or None if we don't know.
+    """
+    if AIR_SENSOR is None:
+        return None if AIR_TEMP_C is None else (AIR_TEMP_C, AIR_HUMIDITY_PCT)
+    with _air_lock:
+        if _air["sensor"] is None:
+            _air["sensor"] = AirSensor(None if AIR_SENSOR == "auto" else AIR_SENSOR, every_s=AIR_SENSOR_EVERY_S)
+        # A bad reading keeps the last good one (see AirSensor.latest)
+        temp_c, humidity = _air["sensor"].latest()
+    return temp_c, AIR_HUMIDITY_PCT if humidity is None else humidity
+
+
+def echo_window():
+    """(earliest, latest) echo time (ms) to look in, from the air temperature, or None."""
+    air = get_air()
+    if air is None:
+        return None
+    # The echo finder sees the echo before the calibration is taken off
+    return tuple(t + calibration_ms() for t in echo_window_ms(TUBE_DISTANCE_M, air[0], air[1], AIR_TEMP_ERROR_C))
+
+
+_calibration = {}
+
+
+def calibration_ms():
+    """
+    The fixed delay (ms) of this microphone and buzzer, saved by
+    calibration.py, to take off every echo time. 0 if there isn't one, or
+    it was measured beeping another way (buzzer or speaker, EXCITATION).
+    """
+    if not USE_CALIBRATION or TIME_FROM != "beep":
+        return 0.0
+    if "profile" not in _calibration:
+        profile = load_profile(device_key(get_backend(), DEVICE))
+        beep_from = "speaker" if get_recorder().can_play else "buzzer"
+        if profile is not None and not matches(profile, beep_from, EXCITATION):
+            profile = None
+        _calibration["profile"] = profile
+    profile = _calibration["profile"]
+    return 0.0 if profile is None else profile["offset_ms"]
+
+
+def expected_speed_m_per_s(air):
+    """What the speed of sound should be in air = get_air() (None if we don't know it)."""
+    return None if air is None else speed_of_sound(*air)
 
 
 def compute_speed_m_per_s(echo_time_ms):
@@ -95,10 +455,41 @@ def compute_speed_m_per_s(echo_time_ms):
     If the echo time is round-trip time:
       speed = (2 * distance) / time
     """
-    t = echo_time_ms / 1000.0
-    if t <= 0:
-        return 0.0
-    return (2.0 * TUBE_DISTANCE_M) / t
+    return speed_m_per_s(echo_time_ms, TUBE_DISTANCE_M)
+
+
+# 95% "t" numbers for small batches, by number of shots minus one.
+# With lots of shots it gets close to 1.96.
+_T95 = [12.71, 4.30, 3.18, 2.78, 2.57, 2.45, 2.36, 2.31, 2.26, 2.23,
+        2.20, 2.18, 2.16, 2.14, 2.13, 2.12, 2.11, 2.10, 2.09, 2.09,
+        2.08, 2.07, 2.07, 2.06, 2.06, 2.06, 2.05, 2.05, 2.05, 2.04]
+
+
+def summarize(values):
+    """
+    Mean, median, spread (std) and 95% confidence interval of a set of
+    measurements. The true value is probably inside the interval.
+    """
+    v = np.asarray(values, dtype=np.float64)
+    v = v[np.isfinite(v)]
+    n = len(v)
+    if n == 0:
+        return {"n": 0, "mean": np.nan, "median": np.nan, "std": np.nan, "ci95": (np.nan, np.nan)}
+    mean = float(v.mean())
+    if n > 1:
+        std = float(v.std(ddof=1))
+        t = _T95[n - 2] if n - 1 <= len(_T95) else 1.96
+        half = t * std / np.sqrt(n)
+    else:
+        std = 0.0
+        half = np.nan
+    return {
+        "n": n,
+        "mean": mean,
+        "median": float(np.median(v)),
+        "std": std,
+        "ci95": (float(mean - half), float(mean + half)),
+    }
 
 
 # -----------------------------
@@ -134,6 +525,34 @@ class EchoApp:
         )
         self.button.pack(pady=(0, 12))
 
+        # Smaller button: lots of shots and an average
+        self.batch_button = tk.Button(
+            left,
+            text=f"MEASURE x{BATCH_SHOTS}",
+            font=("Arial", 16, "bold"),
+            command=self.start_batch_thread
+        )
+        self.batch_button.pack(pady=(0, 12))
+
+        # Average lots of shots into one clean one (for noisy rooms)
+        self.average_button = tk.Button(
+            left,
+            text=f"AVERAGE x{AVERAGE_SHOTS}",
+            font=("Arial", 16, "bold"),
+            command=self.start_average_thread
+        )
+        self.average_button.pack(pady=(0, 12))
+
+        # Keep measuring until pressed again
+        self.sonar = None
+        self.sonar_button = tk.Button(
+            left,
+            text="SONAR: OFF",
+            font=("Arial", 16, "bold"),
+            command=self.toggle_sonar
+        )
+        self.sonar_button.pack(pady=(0, 12))
+
         # Status labels
         self.status = ttk.Label(left, text="Ready.", font=("Arial", 14))
         self.status.pack(pady=6)
@@ -141,103 +560,249 @@ class EchoApp:
         self.result = ttk.Label(left, text="", font=("Arial", 14))
         self.result.pack(pady=6)
 
-        if not HAVE_BUZZER:
-            warn = ttk.Label(left, text="(No buzzer detected)\nGPIO not available.", foreground="red")
+        self.left = left
+        self.right = right
+
+        # The plot is added by build_plot() once matplotlib has loaded
+        self.ax = None
+        self.canvas = None
+        self.pending_plot = None
+
+        # Keep last waveform
+        self.last_wave = None
+
+        # Load the slow stuff in the background so the window is usable now.
+        threading.Thread(target=self.warm_up, daemon=True).start()
+
+    def warm_up(self):
+        """Open the buzzer, load matplotlib and start the microphone (not on the GUI thread)."""
+        have_buzzer = get_buzzer() is not None
+        self.root.after(0, lambda: self.show_buzzer_warning(have_buzzer))
+
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+        self.root.after(0, lambda: self.build_plot(Figure, FigureCanvasTkAgg))
+
+        try:
+            get_recorder()
+        except Exception:
+            # No microphone yet; pressing MEASURE will show the error.
+            pass
+
+    def show_buzzer_warning(self, have_buzzer):
+        if not have_buzzer:
+            warn = ttk.Label(self.left, text="(No buzzer detected)\nGPIO not available.", foreground="red")
             warn.pack(pady=(10, 0))
 
+    def build_plot(self, Figure, FigureCanvasTkAgg):
         # Matplotlib plot
         fig = Figure(figsize=(6, 4), dpi=100)
-        self.ax = fig.add_subplot(111)
-        self.ax.set_title("Waveform")
-        self.ax.set_xlabel("Time (ms)")
-        self.ax.set_ylabel("Amplitude")
-
-        self.line, = self.ax.plot([], [], linewidth=1)
-
-        self.canvas = FigureCanvasTkAgg(fig, master=right)
+        self.canvas = FigureCanvasTkAgg(fig, master=self.right)
+        self.plot = WavePlot(self.canvas)
         self.canvas_widget = self.canvas.get_tk_widget()
         self.canvas_widget.grid(row=0, column=0, sticky="nsew")
 
-        # Keep last waveform
-        self.last_wave = None
+        # A measurement finished before the plot was ready
+        if self.pending_plot is not None:
+            self.draw_wave(*self.pending_plot)
+            self.pending_plot = None
+
+    def set_buttons(self, state):
+        # Only one thing may beep at a time: while sonar is on, only its own
+        # button works, and while a measurement runs, sonar can't start.
+        if self.sonar is not None:
+            state = "disabled"
+        self.button.config(state=state)
+        self.batch_button.config(state=state)
+        self.average_button.config(state=state)
+        self.sonar_button.config(state="normal" if self.sonar is not None else state)
 
     def start_measurement_thread(self):
         # Don’t freeze the GUI while recording.
-        self.button.config(state="disabled")
+        self.set_buttons("disabled")
         self.status.config(text="Measuring...")
         self.result.config(text="")
         t = threading.Thread(target=self.do_measurement, daemon=True)
         t.start()
 
+    def start_batch_thread(self):
+        self.set_buttons("disabled")
+        self.status.config(text=f"Measuring {BATCH_SHOTS} times...")
+        self.result.config(text="")
+        t = threading.Thread(target=self.do_batch_measurement, daemon=True)
+        t.start()
+
+    def start_average_thread(self):
+        self.set_buttons("disabled")
+        self.status.config(text=f"Averaging {AVERAGE_SHOTS} shots...")
+        self.result.config(text="")
+        t = threading.Thread(target=self.do_average_measurement, daemon=True)
+        t.start()
+
+    def toggle_sonar(self):
+        if self.sonar is None:
+            self.sonar = make_sonar().start()
+            self.set_buttons("disabled")
+            self.sonar_button.config(text="SONAR: ON")
+            self.status.config(text="Sonar running...")
+            self.result.config(text="")
+            self.root.after(SONAR_REFRESH_MS, self.poll_sonar)
+        else:
+            self.stop_sonar()
+            self.status.config(text="Ready.")
+
+    def stop_sonar(self):
+        if self.sonar is not None:
+            self.sonar.stop()
+            self.sonar = None
+        self.sonar_button.config(text="SONAR: OFF")
+        self.set_buttons("normal")
+
+    def poll_sonar(self):
+        # Runs on the GUI thread every SONAR_REFRESH_MS while sonar is on
+        sonar = self.sonar
+        if sonar is None:
+            return
+        if sonar.error is not None:
+            self.stop_sonar()
+            self.show_error(sonar.error)
+            return
+
+        frame = sonar.latest()
+        if frame is not None:
+            wave, beep_index, res = frame
+            recent = summarize([r["echo_ms"] for r in sonar.recent(20)])
+            self.result.config(
+                text=(
+                    f"Echo time: {res['echo_ms']:.2f} ms\n"
+                    f"Speed: {res['speed']:.1f} m/s\n"
+                    f"Last 20 average: {compute_speed_m_per_s(recent['mean']):.1f} m/s\n"
+                    f"{sonar.n_results} shots, {sonar.dropped_frames} not drawn"
+                )
+            )
+            if self.canvas is not None:
+                self.draw_wave(wave, res["echo_ms"], beep_index)
+        self.root.after(SONAR_REFRESH_MS, self.poll_sonar)
+
     def do_measurement(self):
         try:
-            # 1) Start recording slightly BEFORE beep so we don’t miss anything
-            # (We record and beep “quickly” in the same thread for simplicity.)
-            # A more advanced version would do tight sync, but this is good enough.
-            wave = self.record_with_beep()
+            # 1) Beep and cut the recording around it. The microphone is always
+            # on, and the beep time is matched to the microphone's own clock,
+            # so we know the exact sample where the beep started (see record_shot).
+            wave, beep_index = self.record_with_beep()
 
-            # 2) Find echo time
-            echo_ms = find_echo_time_ms(wave)
+            # 2) Find echo time (counted from the beep)
+            echo_ms = find_echo_time_ms(wave, beep_index)
             speed = compute_speed_m_per_s(echo_ms)
+            train = echo_train(wave, beep_index)
+            archive_shot(wave, beep_index, echo_ms, speed)
+            # Read here, not on the GUI thread: a sensor can take most of a second
+            air = get_air()
 
             # 3) Update GUI (must happen on main thread)
-            self.root.after(0, lambda: self.update_display(wave, echo_ms, speed))
+            self.root.after(0, lambda: self.update_display(wave, echo_ms, speed, beep_index, train, air))
 
         except Exception as e:
-            self.root.after(0, lambda: self.show_error(e))
+            self.root.after(0, lambda e=e: self.show_error(e))
 
-    def record_with_beep(self):
-        seconds = RECORD_MS / 1000.0
-
-        # Start recording
-        audio = sd.rec(int(seconds * SAMPLE_RATE), samplerate=SAMPLE_RATE, channels=1, dtype="float32")
-
-        # Small pause to ensure recording started
-        time.sleep(0.005)
+    def do_batch_measurement(self):
+        try:
+            batch = measure_batch(BATCH_SHOTS)
+            self.root.after(0, lambda: self.update_batch_display(batch))
+        except Exception as e:
+            self.root.after(0, lambda e=e: self.show_error(e))
 
-        # Beep
-        beep()
+    def do_average_measurement(self):
+        try:
+            avg = measure_averaged(AVERAGE_SHOTS)
+            self.root.after(0, lambda: self.update_average_display(avg))
+        except Exception as e:
+            self.root.after(0, lambda e=e: self.show_error(e))
 
-        # Wait for recording to finish
-        sd.wait()
-        return audio[:, 0]
+    def record_with_beep(self):
+        return record_shot()
 
-    def update_display(self, wave, echo_ms, speed):
+    def update_display(self, wave, echo_ms, speed, beep_index=None, train=None, air=None):
         self.status.config(text="Done!")
-
+        self.last_wave = wave
+
+        if np.isfinite(echo_ms):
+            text = f"Echo time: {echo_ms:.2f} ms\nSpeed: {speed:.1f} m/s"
+        else:
+            text = "No clear echo (too noisy?)\nTry again."
+        expected = expected_speed_m_per_s(air)
+        if expected is not None:
+            text += f"\nShould be: {expected:.1f} m/s at {air[0]:.1f} C"
+        if train is not None:
+            # Several round trips in one shot: the spacing doesn't care about delays
+            text += f"\nFrom {len(train['orders'])} echoes: {train['speed_m_per_s']:.1f} m/s"
+        self.result.config(text=text)
+
+        if self.canvas is None:
+            self.pending_plot = (wave, echo_ms, beep_index)
+        else:
+            self.draw_wave(wave, echo_ms, beep_index)
+
+        self.set_buttons("normal")
+
+    def draw_wave(self, wave, echo_ms, beep_index):
+        # Plot waveform (time 0 is the beep, if we know when it was)
+        origin = 0.0 if beep_index is None else beep_index
+        x_ms = (np.arange(len(wave)) - origin) / SAMPLE_RATE * 1000.0
+        self.plot.show(x_ms, wave, echo_ms)
+
+    def update_batch_display(self, batch):
+        # Show the last shot, with the line at the average echo time
+        echo = batch["echo_stats"]
+        speed = batch["speed_stats"]
+        self.update_display(batch["waves"][-1], echo["mean"], speed["mean"], batch["beep_indexes"][-1],
+                            air=batch["air"])
+
+        def plus_minus(stats):
+            return (stats["ci95"][1] - stats["ci95"][0]) / 2.0
+
+        thrown_out = len(batch["echo_ms"]) - echo["n"]
         self.result.config(
-            text=f"Echo time: {echo_ms:.2f} ms\nSpeed: {speed:.1f} m/s"
+            text=(
+                f"{echo['n']} shots" + (f" ({thrown_out} thrown out)" if thrown_out else "") + "\n"
+                f"Echo time: {echo['mean']:.3f} ± {plus_minus(echo):.3f} ms\n"
+                f"Speed: {speed['mean']:.1f} ± {plus_minus(speed):.1f} m/s\n"
+                f"(median {speed['median']:.1f}, spread {speed['std']:.1f})"
+            )
         )
 
-        # Plot waveform
-        x_ms = np.arange(len(wave)) / SAMPLE_RATE * 1000.0
-
-        self.ax.clear()
-        self.ax.set_title("Waveform (click MEASURE to record again)")
-        self.ax.set_xlabel("Time (ms)")
-        self.ax.set_ylabel("Amplitude")
-
-        self.ax.plot(x_ms, wave, linewidth=1)
-
-        # Draw a vertical line where we think the echo peak is
-        self.ax.axvline(echo_ms, linestyle="--", linewidth=1)
-        self.canvas.draw()
-
-        self.button.config(state="normal")
+    def update_average_display(self, avg):
+        self.update_display(avg["wave"], avg["echo_ms"], avg["speed"], avg["beep_index"], air=avg["air"])
+        snr = avg["snr_db"][-1][1] if avg["snr_db"] else float("nan")
+        self.result.config(
+            text=(
+                f"{avg['n']} shots averaged\n"
+                f"Echo time: {avg['echo_ms']:.3f} ms\n"
+                f"Speed: {avg['speed']:.1f} m/s\n"
+                f"Signal/noise: {snr:.1f} dB"
+            )
+        )
 
     def show_error(self, e):
         self.status.config(text="Error!")
         self.result.config(text=str(e))
-        self.button.config(state="normal")
+        self.set_buttons("normal")
 
 
 def main():
-    # This makes sounddevice use a reasonable default latency.
-    sd.default.latency = ("low", "low")
-
     root = tk.Tk()
     app = EchoApp(root)
-    root.mainloop()
+    try:
+        root.mainloop()
+    finally:
+        if app.sonar is not None:
+            app.sonar.stop()
+        if _recorder is not None:
+            _recorder.close()
+        if _archive is not None:
+            _archive.close()
+        if _parallel is not None:
+            _parallel.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,215 @@
+#  Copyright 2026 Nolan Stokely <nolan@stokely.org>
+"""
+Keep every shot on disk, not just the last one.
+
+A shot archive is a folder with three files:
+
+    samples.f32     every shot's raw sound, one after another (float32)
+    index.bin       one small record per shot (see INDEX_DTYPE): when it was
+                    taken, where its sound is in samples.f32, the echo time
+                    and speed, and which settings it was taken with
+    archive.json    the sample rate and the list of settings
+
+Both .f32 and .bin are "memory-mapped": the computer treats the file as if
+it were an array in memory and only loads the pieces we look at. So tens of
+thousands of shots don't need tens of thousands of shots' worth of RAM,
+and reading shots back (archive.wave(k), archive.waves(...)) doesn't copy
+them. The files are made bigger in big steps (doubling), not one shot at a
+time, so adding a shot is quick.
+
+    archive = ShotArchive("shots", SAMPLE_RATE)
+    settings = shot_settings("beep", beep_ms=8, freq_hz=2700, distance_m=3.0)
+    archive.append(wave, beep_index, echo_ms, speed, settings)
+    ...
+    archive = ShotArchive("shots", mode="r")
+    good = np.isfinite(archive.index["echo_ms"])
+    waves = archive.waves(np.flatnonzero(good))
+"""
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+INDEX_DTYPE = np.dtype([
+    ("time", "f8"),             # time.time() when the shot was taken
+    ("offset", "i8"),           # first sample in samples.f32
+    ("length", "i4"),           # number of samples (0 = no shot here yet)
+    ("settings", "i4"),         # which entry of settings() it was taken with
+    ("beep_index", "f8"),       # sample in the shot where the beep started (NaN = unknown)
+    ("echo_ms", "f8"),          # NaN = no clear echo
+    ("speed_m_per_s", "f8"),
+])
+
+# Room for this many samples and shots before the files first have to grow
+# (about 4 MB and 48 kB).
+START_SAMPLES = 1 << 20
+START_SHOTS = 1024
+
+
+def shot_settings(excitation, beep_ms, freq_hz, chip_us=None, beep_from="buzzer", averaged=1,
+                  detector="matched", refine="parabolic", envelope="none", cfar_db=None, time_from="beep",
+                  distance_m=None, calibration_ms=0.0):
+    """
+    The settings a shot was taken with, for append(). scifair.py and
+    scifairgui.py both make them here, so an archive has the same keys
+    whichever one wrote it (replay.py reads them back). The names are
+    echo_times_ms's, plus beep_from ("buzzer" or "speaker"), averaged (how
+    many beeps went into the shot) and calibration_ms (the delay that was
+    taken off echo_ms, see calibration.py).
+    """
+    return {
+        "excitation": excitation, "beep_ms": beep_ms, "freq_hz": freq_hz, "chip_us": chip_us,
+        "beep_from": beep_from, "averaged": averaged, "detector": detector, "refine": refine,
+        "envelope": envelope, "cfar_db": cfar_db, "time_from": time_from, "distance_m": distance_m,
+        "calibration_ms": calibration_ms,
+    }
+
+
+def _none_to_nan(x):
+    return np.nan if x is None else float(x)
+
+
+class ShotArchive:
+    """
+    Folder of shots (see the top of this file). mode "a" adds to the
+    archive (making it if needed, sample_rate required then), "r" only
+    reads it.
+    """
+
+    def __init__(self, path, sample_rate=None, mode="a"):
+        if mode not in ("a", "r"):
+            raise ValueError(f"unknown mode: {mode!r}")
+        self.path = path
+        self.mode = mode
+        self._lock = threading.Lock()
+        meta_path = os.path.join(path, "archive.json")
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                self._meta = json.load(f)
+            if sample_rate is not None and sample_rate != self._meta["sample_rate"]:
+                raise ValueError(f"{path} was recorded at {self._meta['sample_rate']} Hz, not {sample_rate}")
+        elif mode == "r":
+            raise FileNotFoundError(f"no shot archive in {path}")
+        else:
+            if sample_rate is None:
+                raise ValueError("sample_rate is needed to make a new archive")
+            os.makedirs(path, exist_ok=True)
+            self._meta = {"sample_rate": int(sample_rate), "settings": []}
+            self._save_meta()
+            for name, size in (("samples.f32", START_SAMPLES * 4), ("index.bin", START_SHOTS * INDEX_DTYPE.itemsize)):
+                with open(os.path.join(path, name), "wb") as f:
+                    f.truncate(size)
+        self.sample_rate = self._meta["sample_rate"]
+        self._settings_ids = {json.dumps(s, sort_keys=True): k for k, s in enumerate(self._meta["settings"])}
+        self._map()
+        # The first record that hasn't been filled in yet. A shot's sound is
+        # written before its record, so a crash never leaves a record
+        # pointing at missing sound.
+        empty = np.flatnonzero(self._index["length"] == 0)
+        self.n = int(empty[0]) if len(empty) else len(self._index)
+        self._end = int(self._index["offset"][self.n - 1] + self._index["length"][self.n - 1]) if self.n else 0
+
+    def _map(self):
+        file_mode = "r" if self.mode == "r" else "r+"
+        self._samples = np.memmap(os.path.join(self.path, "samples.f32"), np.float32, file_mode)
+        self._index = np.memmap(os.path.join(self.path, "index.bin"), INDEX_DTYPE, file_mode)
+
+    def _save_meta(self):
+        tmp = os.path.join(self.path, "archive.json.tmp")
+        with open(tmp, "w") as f:
+            json.dump(self._meta, f, indent=1)
+        os.replace(tmp, os.path.join(self.path, "archive.json"))
+
+    def _grow(self, need_samples, need_shots):
+        """Make the files at least this big, doubling so it doesn't happen often."""
+        grew = False
+        for name, have, need, item in (("samples.f32", len(self._samples), need_samples, 4),
+                                       ("index.bin", len(self._index), need_shots, INDEX_DTYPE.itemsize)):
+            if need > have:
+                size = have
+                while size < need:
+                    size *= 2
+                with open(os.path.join(self.path, name), "r+b") as f:
+                    f.truncate(size * item)
+                grew = True
+        if grew:
+            # Arrays handed out before this still work: they keep the old map.
+            self._samples.flush()
+            self._index.flush()
+            self._map()
+
+    def __len__(self):
+        return self.n
+
+    @property
+    def index(self):
+        """Every shot's record (see INDEX_DTYPE), without copying."""
+        return self._index[:self.n]
+
+    def settings(self, k=None):
+        """The settings shot k was taken with, or the list of all of them."""
+        if k is None:
+            return list(self._meta["settings"])
+        return self._meta["settings"][int(self._index["settings"][k])]
+
+    def append(self, wave, beep_index=None, echo_ms=None, speed=None, settings=None, when=None):
+        """Add one shot. Returns its number."""
+        if self.mode == "r":
+            raise ValueError("archive was opened read-only")
+        wave = np.asarray(wave, dtype=np.float32).ravel()
+        key = json.dumps(settings or {}, sort_keys=True)
+        with self._lock:
+            settings_id = self._settings_ids.get(key)
+            if settings_id is None:
+                settings_id = len(self._meta["settings"])
+                self._meta["settings"].append(json.loads(key))
+                self._settings_ids[key] = settings_id
+                self._save_meta()
+            k = self.n
+            self._grow(self._end + len(wave), k + 1)
+            self._samples[self._end:self._end + len(wave)] = wave
+            self._index[k] = (time.time() if when is None else when, self._end, len(wave), settings_id,
+                              _none_to_nan(beep_index), _none_to_nan(echo_ms), _none_to_nan(speed))
+            self._end += len(wave)
+            self.n += 1
+        return k
+
+    def wave(self, k):
+        """Shot k's sound, straight from the file (no copy)."""
+        if not -self.n <= k < self.n:
+            raise IndexError(f"shot {k} is not in the archive ({self.n} shots)")
+        rec = self._index[k % self.n]
+        return self._samples[rec["offset"]:rec["offset"] + rec["length"]]
+
+    def waves(self, shots=None):
+        """
+        Several shots as one array, one per row (all of them if shots is None).
+        If they are next to each other in the file and the same length, this
+        is a view of the file; otherwise they are copied. Shots of different
+        lengths are padded with zeros at the end.
+        """
+        shots = np.arange(self.n) if shots is None else np.asarray(shots, dtype=np.int64).ravel()
+        if len(shots) == 0:
+            return np.zeros((0, 0), dtype=np.float32)
+        rec = self._index[shots % self.n]
+        lengths = rec["length"]
+        length = int(lengths.max())
+        if np.all(lengths == length) and np.all(np.diff(rec["offset"]) == length):
+            start = int(rec["offset"][0])
+            return self._samples[start:start + length * len(shots)].reshape(len(shots), length)
+        out = np.zeros((len(shots), length), dtype=np.float32)
+        for row, (offset, n) in enumerate(zip(rec["offset"], lengths)):
+            out[row, :n] = self._samples[offset:offset + n]
+        return out
+
+    def flush(self):
+        """Make sure everything so far is written to disk."""
+        if self.mode != "r":
+            with self._lock:
+                self._samples.flush()
+                self._index.flush()
+
+    def close(self):
+        self.flush()
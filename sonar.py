@@ -0,0 +1,128 @@
+#  Copyright 2026 Nolan Stokely <nolan@stokely.org>
+"""
+Continuous "sonar" measuring.
+
+Three jobs run at the same time, passing shots along like a bucket brigade:
+
+    capture thread  --shots-->  detect thread  --frames-->  screen (Tk loop)
+
+While shot k+1 is being recorded, shot k is being worked out and shot k-1
+is being drawn. The queues between them are small. If working out falls
+behind, recording waits for it (we never throw a measurement away). If the
+screen falls behind, old pictures are skipped instead (dropped_frames).
+Sonar can run for hours, so only the newest keep_results results are kept
+(n_results counts them all).
+"""
+import collections
+import queue
+import threading
+import time
+
+
+class SonarPipeline:
+    """
+    capture() -> (wave, beep_index) takes one shot.
+    detect(wave, beep_index) -> result works it out (e.g. a dict with the echo time).
+    gap_ms is an extra wait between shots so the tube can go quiet.
+    """
+
+    def __init__(self, capture, detect, gap_ms=0.0, shot_queue=4, frame_queue=2, keep_results=1000):
+        self.capture = capture
+        self.detect = detect
+        self.gap_ms = gap_ms
+        self.shots = queue.Queue(maxsize=shot_queue)
+        self.frames = queue.Queue(maxsize=frame_queue)
+        self.results = collections.deque(maxlen=keep_results)   # the newest results, in order
+        self.n_results = 0
+        self._results_lock = threading.Lock()
+        self.dropped_frames = 0
+        self.error = None
+        self._stop = threading.Event()
+        self._threads = []
+
+    @property
+    def running(self):
+        return any(t.is_alive() for t in self._threads)
+
+    def start(self):
+        self._stop.clear()
+        self._threads = [
+            threading.Thread(target=self._capture_loop, daemon=True),
+            threading.Thread(target=self._detect_loop, daemon=True),
+        ]
+        for t in self._threads:
+            t.start()
+        return self
+
+    def stop(self, timeout=2.0):
+        self._stop.set()
+        for t in self._threads:
+            t.join(timeout)
+
+    def _fail(self, e):
+        self.error = e
+        self._stop.set()
+
+    def _capture_loop(self):
+        try:
+            while not self._stop.is_set():
+                shot = self.capture()
+                # Wait for room rather than drop the shot (backpressure)
+                while not self._stop.is_set():
+                    try:
+                        self.shots.put(shot, timeout=0.1)
+                        break
+                    except queue.Full:
+                        pass
+                if self.gap_ms > 0:
+                    time.sleep(self.gap_ms / 1000.0)
+        except Exception as e:
+            self._fail(e)
+
+    def _detect_loop(self):
+        try:
+            while not self._stop.is_set() or not self.shots.empty():
+                try:
+                    wave, beep_index = self.shots.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                result = self.detect(wave, beep_index)
+                with self._results_lock:
+                    self.results.append(result)
+                    self.n_results += 1
+                self._show(wave, beep_index, result)
+        except Exception as e:
+            self._fail(e)
+
+    def _show(self, wave, beep_index, result):
+        # The screen only needs the newest picture: if it's behind, skip the oldest one
+        frame = (wave, beep_index, result)
+        while True:
+            try:
+                self.frames.put_nowait(frame)
+                return
+            except queue.Full:
+                try:
+                    self.frames.get_nowait()
+                    self.dropped_frames += 1
+                except queue.Empty:
+                    pass
+
+    def recent(self, n):
+        """The newest n results (a list, oldest first). Safe to call while sonar runs."""
+        with self._results_lock:
+            return list(self.results)[-n:]
+
+    def latest(self):
+        """Newest (wave, beep_index, result) waiting to be drawn, or None. Call from the GUI."""
+        frame = None
+        skipped = -1
+        while True:
+            try:
+                frame = self.frames.get_nowait()
+                skipped += 1
+            except queue.Empty:
+                break
+        if skipped > 0:
+            self.dropped_frames += skipped
+        return frame
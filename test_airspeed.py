@@ -0,0 +1,67 @@
+#  Copyright 2026 Nolan Stokely <nolan@stokely.org>
+"""Checks for the expected echo time and the temperature sensor."""
+import pytest
+
+from airspeed import AirSensor, echo_window_ms, expected_echo_ms, speed_of_sound
+
+GOOD = "72 01 4b 46 7f ff 0e 10 57 : crc=57 YES\n72 01 4b 46 7f ff 0e 10 57 t={}\n"
+BAD = "72 01 4b 46 7f ff 0e 10 57 : crc=00 NO\n72 01 4b 46 7f ff 0e 10 57 t=85000\n"
+
+
+def test_speed_of_sound():
+    assert speed_of_sound(0.0) == pytest.approx(331.3)
+    assert speed_of_sound(20.0) == pytest.approx(343.2, abs=0.1)
+    assert speed_of_sound(20.0, 50.0) > speed_of_sound(20.0)
+
+
+def test_echo_window_holds_the_echo():
+    early, late = echo_window_ms(3.0, 20.0)
+    for temp_c in (17.0, 20.0, 23.0):
+        assert early < expected_echo_ms(3.0, temp_c) < late
+    # Knowing the humidity narrows it
+    dry_early, dry_late = echo_window_ms(3.0, 20.0, humidity_pct=40.0)
+    assert early < dry_early and dry_late < late
+
+
+def test_reads_a_1wire_sensor(tmp_path):
+    path = tmp_path / "w1_slave"
+    path.write_text(GOOD.format(21500))
+    assert AirSensor(str(path)).read() == (21.5, None)
+    path.write_text(BAD)
+    with pytest.raises(ValueError):
+        AirSensor(str(path)).read()
+
+
+def test_latest_tries_again_and_keeps_the_last_good_reading(tmp_path):
+    path = tmp_path / "w1_slave"
+    path.write_text(BAD)
+    sensor = AirSensor(str(path))
+    # Never had a good reading: nothing to fall back on
+    with pytest.raises(ValueError):
+        sensor.latest()
+
+    path.write_text(GOOD.format(21500))
+    assert sensor.latest() == (21.5, None)
+    path.write_text(BAD)
+    assert sensor.latest() == (21.5, None)
+
+    # A bad CRC now and then: the next try gets a good one
+    reads = iter([ValueError("bad"), ValueError("bad"), (22.0, None)])
+
+    def flaky():
+        r = next(reads)
+        if isinstance(r, Exception):
+            raise r
+        return r
+    sensor.read = flaky
+    assert sensor.latest() == (22.0, None)
+
+
+def test_latest_waits_every_s(tmp_path):
+    path = tmp_path / "air.txt"
+    path.write_text("20.0 40")
+    sensor = AirSensor(str(path), every_s=60.0)
+    assert sensor.latest() == (20.0, 40.0)
+    path.write_text("25.0 40")
+    assert sensor.latest() == (20.0, 40.0)
+    assert sensor.read() == (25.0, 40.0)
@@ -0,0 +1,47 @@
+#  Copyright 2026 Nolan Stokely <nolan@stokely.org>
+"""Checks for the ring buffer, fed by hand (no microphone stream)."""
+import numpy as np
+import pytest
+
+from audiocapture import RingRecorder
+
+
+def filled(total, block=37):
+    # Frame k holds the value k, so a copy shows exactly which frames it got
+    rec = RingRecorder(1000, seconds=0.1)
+    for start in range(0, total, block):
+        rec.write(np.arange(start, min(total, start + block), dtype=np.float32))
+    return rec
+
+
+def test_snapshot_across_the_wrap():
+    rec = filled(250)
+    assert rec.capacity == 100 and rec.frames_written == 250
+    # Frames 180..229 sit at the end and the start of the buffer
+    assert np.array_equal(rec.snapshot(180, 50), np.arange(180, 230))
+    assert np.array_equal(rec.snapshot(150, 100), np.arange(150, 250))
+
+
+def test_block_bigger_than_the_ring():
+    rec = RingRecorder(1000, seconds=0.1)
+    rec.write(np.arange(0, 30, dtype=np.float32))
+    rec.write(np.arange(30, 275, dtype=np.float32))
+    assert rec.frames_written == 275
+    assert np.array_equal(rec.snapshot(175, 100), np.arange(175, 275))
+
+
+def test_refuses_audio_it_does_not_have():
+    rec = filled(250)
+    with pytest.raises(ValueError):
+        rec.snapshot(240, 20)          # not recorded yet
+    with pytest.raises(ValueError):
+        rec.snapshot(100, 150)         # more than the ring holds
+    with pytest.raises(RuntimeError):
+        rec.snapshot(149, 10)          # already overwritten (lapped)
+
+
+def test_snapshot_around_a_fractional_frame():
+    rec = filled(250)
+    wave, index = rec.snapshot_at_frame(200.25, 10, 20)
+    assert np.array_equal(wave, np.arange(190, 220))
+    assert index == pytest.approx(10.25)
@@ -0,0 +1,52 @@
+#  Copyright 2026 Nolan Stokely <nolan@stokely.org>
+"""Checks for the latency calibration: the fits, profiles and matching."""
+import numpy as np
+import pytest
+
+from calibration import (device_key, fit_two_distances, load_profile, matches, offset_from_known_speed,
+                         save_profile)
+
+
+def test_two_distances_finds_offset_and_speed():
+    rng = np.random.default_rng(1)
+    distances = [2.0, 3.0]
+    echo_ms = [0.4 + 2000.0 * d / 343.0 + rng.normal(0, 0.02, 30) for d in distances]
+    echo_ms[0][5] = np.nan      # a shot with no clear echo is left out
+    fit = fit_two_distances(distances, echo_ms)
+    assert fit["offset_ms"] == pytest.approx(0.4, abs=0.05)
+    assert fit["speed_m_per_s"] == pytest.approx(343.0, abs=0.5)
+    assert 0 < fit["offset_err_ms"] < 0.05
+    with pytest.raises(ValueError):
+        fit_two_distances([2.0, 2.0], echo_ms)
+
+
+def test_offset_from_known_speed():
+    echo_ms = [0.3 + 2000.0 * 2.0 / 343.0] * 5 + [np.nan]
+    assert offset_from_known_speed(echo_ms, 2.0, 343.0) == pytest.approx(0.3)
+
+
+def test_profile_only_matches_the_same_beep():
+    profile = {"offset_ms": 0.3, "beep_from": "buzzer", "excitation": "beep"}
+    assert matches(profile, "buzzer", "beep")
+    assert not matches(profile, "speaker", "beep")
+    assert not matches(profile, "buzzer", "barker13")
+    # Saved before beep_from was kept: those were all buzzer shots
+    assert matches({"offset_ms": 0.3, "excitation": "beep"}, "buzzer", "beep")
+
+
+def test_profiles_are_kept_per_device(tmp_path):
+    path = str(tmp_path / "calibration.json")
+    assert load_profile("USB mic", path) is None
+    save_profile("USB mic", {"offset_ms": 0.3}, path)
+    save_profile("default", {"offset_ms": 0.5}, path)
+    save_profile("USB mic", {"offset_ms": 0.4}, path)
+    assert load_profile("USB mic", path) == {"offset_ms": 0.4}
+    assert load_profile("default", path) == {"offset_ms": 0.5}
+
+
+def test_device_key_without_a_name():
+    class NoNames:
+        def device_name(self, device):
+            raise RuntimeError("no sound card")
+    assert device_key(NoNames()) == "default"
+    assert device_key(NoNames(), 2) == "device 2"
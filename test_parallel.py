@@ -0,0 +1,34 @@
+#  Copyright 2026 Nolan Stokely <nolan@stokely.org>
+"""Checks that ParallelDetector gives the same answers as echo_times_ms."""
+import numpy as np
+
+from backends import SimulatedBackend, Tube
+from echofinder import echo_times_ms, speed_m_per_s
+from excitation import make_excitation
+from parallel import MIN_CHUNK_SHOTS, ParallelDetector
+
+SAMPLE_RATE = 48000
+
+
+def test_matches_echo_times_ms():
+    backend = SimulatedBackend(Tube(), seed=1)
+    # Enough shots for several slices, and beep times with a gap in them
+    n_shots = 3 * MIN_CHUNK_SHOTS + 5
+    waves, beep_indexes = backend.record_shots(n_shots, SAMPLE_RATE, 96 + 40 * 48, 96, 8)
+    beep_indexes[3] = None
+    excitation = make_excitation("beep", beep_ms=8)
+    settings = dict(pulse_ms=excitation.blank_ms, matched_filter=excitation.matched_filter(SAMPLE_RATE),
+                    envelope="hilbert", search_end_ms=35)
+    expected = echo_times_ms(waves, SAMPLE_RATE, beep_indexes, **settings)
+
+    with ParallelDetector(SAMPLE_RATE, 3.0, workers=2, **settings) as detector:
+        results = detector.detect(waves, beep_indexes)
+        assert np.allclose(results["echo_ms"], expected, equal_nan=True)
+        assert np.allclose(results["speed_m_per_s"], [speed_m_per_s(t, 3.0) for t in expected], equal_nan=True)
+        assert np.isnan(results["beep_index"][3])
+        # Overrides only change this batch; the blocks are reused for a smaller one
+        window = detector.detect(waves, beep_indexes, search_window_ms=(30.0, 40.0))
+        timed = np.delete(window["echo_ms"], 3)
+        assert np.all(timed[np.isfinite(timed)] >= 30.0)
+        again = detector.detect(waves[:10], beep_indexes[:10])
+        assert np.allclose(again["echo_ms"], expected[:10], equal_nan=True)
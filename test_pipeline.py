@@ -0,0 +1,124 @@
+#  Copyright 2026 Nolan Stokely <nolan@stokely.org>
+"""
+Checks for the timing and echo finding, on the pretend tube (no Pi needed):
+
+    python -m pytest -q
+"""
+import numpy as np
+
+from averaging import CoherentAverage
+from backends import SimulatedBackend, Tube
+from echofinder import echo_times_ms, find_echoes, hilbert_envelope, lowpass_envelope
+from excitation import make_excitation
+from pulses import MockPin, SoftwarePulser
+
+SAMPLE_RATE = 48000
+BEEP_MS = 8
+BEEP_INDEX = 96             # 2 ms of sound before the beep
+TOLERANCE_MS = 0.3          # about 1 cm of tube
+
+
+def record(n_shots, record_ms=40, seed=1, **tube):
+    tube = Tube(**tube)
+    backend = SimulatedBackend(tube, seed=seed)
+    n = BEEP_INDEX + int(record_ms * SAMPLE_RATE / 1000)
+    waves, beep_indexes = backend.record_shots(n_shots, SAMPLE_RATE, n, BEEP_INDEX, BEEP_MS)
+    return tube, waves, beep_indexes
+
+
+def settings():
+    """What the apps find echoes with (see scifairgui.echo_settings)."""
+    excitation = make_excitation("beep", beep_ms=BEEP_MS)
+    return dict(pulse_ms=excitation.blank_ms, pulse_freq_hz=excitation.freq_hz,
+                matched_filter=excitation.matched_filter(SAMPLE_RATE), envelope="hilbert")
+
+
+def test_pulse_width():
+    pin = MockPin()
+    SoftwarePulser(pin).pulse(BEEP_MS * 1000)
+    assert pin.value == 0
+    [width] = pin.widths_us()
+    assert abs(width - BEEP_MS * 1000) < 500
+
+
+def test_train_widths_and_gaps():
+    pin = MockPin()
+    pattern = [(1000, 2000), (3000, 1000), (1000, 0)]
+    start = SoftwarePulser(pin).train(pattern)
+    widths = pin.widths_us()
+    assert len(widths) == len(pattern)
+    for width, (on_us, _) in zip(widths, pattern):
+        assert abs(width - on_us) < 500
+    # Edges are timed from the first one, so the train doesn't drift
+    ons = [t for t, v in pin.edges if v == 1]
+    assert abs((ons[-1] - ons[0]) / 1000.0 - 7000) < 500
+    assert abs(start - ons[0]) < 500_000
+
+
+def test_echo_times_ms():
+    tube, waves, beep_indexes = record(20)
+    echo_ms = echo_times_ms(waves, SAMPLE_RATE, beep_indexes, **settings())
+    assert np.all(np.isfinite(echo_ms))
+    assert abs(np.median(echo_ms) - tube.echo_delay_ms()) < TOLERANCE_MS
+
+
+def test_echo_times_ms_from_direct_sound():
+    # The direct sound and the echo go through the same detector, so a slow
+    # buzzer (latency_ms) cancels out
+    tube, waves, beep_indexes = record(10, latency_ms=1.5)
+    echo_ms = echo_times_ms(waves, SAMPLE_RATE, beep_indexes, time_from="direct", **settings())
+    expected = tube.echo_delay_ms() - tube.latency_ms - tube.direct_delay_ms
+    assert abs(np.median(echo_ms) - expected) < TOLERANCE_MS
+
+
+def test_echo_times_ms_batch_matches_one_at_a_time():
+    _, waves, beep_indexes = record(4)
+    batch = echo_times_ms(waves, SAMPLE_RATE, beep_indexes, **settings())
+    one = [echo_times_ms(w[None, :], SAMPLE_RATE, [b], **settings())[0] for w, b in zip(waves, beep_indexes)]
+    assert np.allclose(batch, one)
+
+
+def test_coherent_average():
+    tube, waves, beep_indexes = record(16, noise=0.1)
+    s = settings()
+    average = CoherentAverage(SAMPLE_RATE, pulse_freq_hz=s["pulse_freq_hz"], matched_filter=s["matched_filter"])
+    for wave, beep_index in zip(waves, beep_indexes):
+        assert average.add(wave, beep_index)
+    # Noise averages away, the echo doesn't: about 3 dB better every time the shots double
+    assert average.snr_db[-1][1] > average.snr_db[0][1] + 6
+    echo_ms = echo_times_ms(average.mean()[None, :], SAMPLE_RATE, [average.beep_index], **s)[0]
+    assert abs(echo_ms - tube.echo_delay_ms()) < TOLERANCE_MS
+
+
+def test_find_echoes():
+    tube, waves, beep_indexes = record(1, record_ms=60)
+    echoes = find_echoes(waves[0], SAMPLE_RATE, beep_indexes[0], **settings())
+    assert len(echoes) >= 2
+    assert abs(echoes[0]["time_ms"] - tube.echo_delay_ms(1)) < TOLERANCE_MS
+    assert abs(echoes[1]["time_ms"] - tube.echo_delay_ms(2)) < 2 * TOLERANCE_MS
+
+
+def test_cfar_throws_out_shots_without_an_echo():
+    tube, waves, beep_indexes = record(10)
+    _, quiet, quiet_beeps = record(10, echo_gain=0.0)
+    # Without CFAR the biggest bump is picked even if it's only noise
+    cfar = dict(settings(), cfar_margin_db=10, search_end_ms=None)
+    echo_ms = echo_times_ms(waves, SAMPLE_RATE, beep_indexes, **cfar)
+    assert np.all(np.abs(echo_ms - tube.echo_delay_ms()) < TOLERANCE_MS)
+    assert np.all(np.isnan(echo_times_ms(quiet, SAMPLE_RATE, quiet_beeps, **cfar)))
+
+
+def test_envelopes_follow_the_outline():
+    # A 2700 Hz tone that swells and fades: the envelope should be the swell,
+    # peaking at the same sample (neither envelope shifts anything in time)
+    t = np.arange(2000) / SAMPLE_RATE
+    outline = np.exp(-0.5 * ((t - 0.02) / 0.004) ** 2)
+    x = outline * np.sin(2 * np.pi * 2700 * t)
+    middle = slice(300, 1700)
+    for envelope in (hilbert_envelope(x), lowpass_envelope(x, SAMPLE_RATE, 1350)):
+        assert np.max(np.abs(envelope - outline)[middle]) < 1e-3
+        assert np.argmax(envelope) == np.argmax(outline)
+    # One row per shot works the same as one at a time
+    both = np.stack([x, 0.5 * x])
+    assert np.allclose(hilbert_envelope(both)[1], 0.5 * hilbert_envelope(x))
+    assert np.allclose(lowpass_envelope(both, SAMPLE_RATE, 1350)[1], 0.5 * lowpass_envelope(x, SAMPLE_RATE, 1350))
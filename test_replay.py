@@ -0,0 +1,56 @@
+#  Copyright 2026 Nolan Stokely <nolan@stokely.org>
+"""Checks for replay.py, on archives and .npy files made with the pretend tube."""
+import numpy as np
+
+import replay
+from backends import SimulatedBackend, Tube
+from echofinder import echo_times_ms
+from excitation import make_excitation
+from shotarchive import ShotArchive, shot_settings
+
+SAMPLE_RATE = 48000
+BEEP_INDEX = 96
+
+
+def record(n_shots, seed=1):
+    tube = Tube()
+    waves, beep_indexes = SimulatedBackend(tube, seed=seed).record_shots(
+        n_shots, SAMPLE_RATE, BEEP_INDEX + 40 * 48, BEEP_INDEX, 8)
+    return tube, waves, beep_indexes
+
+
+def test_archive_replays_with_its_own_settings(tmp_path):
+    # Not replay's defaults, so they have to come from the archive
+    _, waves, beep_indexes = record(6)
+    excitation = make_excitation("beep", beep_ms=8)
+    settings = shot_settings("beep", 8, 2700, envelope="none", refine="gaussian", distance_m=3.0)
+    echo_ms = echo_times_ms(waves, SAMPLE_RATE, beep_indexes, pulse_ms=excitation.blank_ms,
+                            matched_filter=excitation.matched_filter(SAMPLE_RATE), envelope="none",
+                            refine="gaussian", search_end_ms=35)
+    archive = ShotArchive(str(tmp_path), SAMPLE_RATE)
+    for wave, beep_index, t in zip(waves, beep_indexes, echo_ms):
+        archive.append(wave, beep_index, t, None, settings)
+    archive.close()
+
+    opts = replay.parse_args([str(tmp_path), "--chunk", "4"])
+    units = replay.plan(opts.sources, opts)
+    assert len(units) == 2
+    table = replay.replay(units, workers=1)
+    assert [row["shot"] for row in table] == list(range(6))
+    assert np.allclose([row["echo_ms"] for row in table], [row["old_echo_ms"] for row in table])
+
+    # An option overrides the archive
+    opts = replay.parse_args([str(tmp_path), "--envelope", "hilbert"])
+    table = replay.replay(replay.plan(opts.sources, opts), workers=1)
+    assert not np.allclose([row["echo_ms"] for row in table], echo_ms)
+
+
+def test_npy_needs_the_beep_time(tmp_path):
+    tube, waves, _ = record(4)
+    path = str(tmp_path / "shots.npy")
+    np.save(path, waves)
+    for extra in (["--beep-index", str(BEEP_INDEX)], ["--time-from", "direct"]):
+        opts = replay.parse_args([path, "--sample-rate", str(SAMPLE_RATE)] + extra)
+        table = replay.replay(replay.plan(opts.sources, opts), workers=1)
+        expected = tube.echo_delay_ms() - (tube.direct_delay_ms if "direct" in extra else 0.0)
+        assert abs(np.median([row["echo_ms"] for row in table]) - expected) < 0.5
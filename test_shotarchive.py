@@ -0,0 +1,50 @@
+#  Copyright 2026 Nolan Stokely <nolan@stokely.org>
+"""Checks for the shot archive: growing the files and reading them back."""
+import numpy as np
+import pytest
+
+import shotarchive
+from shotarchive import ShotArchive, shot_settings
+
+
+def test_grows_and_reopens(tmp_path, monkeypatch):
+    # Tiny files, so they have to grow a few times
+    monkeypatch.setattr(shotarchive, "START_SAMPLES", 64)
+    monkeypatch.setattr(shotarchive, "START_SHOTS", 2)
+    rng = np.random.default_rng(1)
+    waves = [rng.standard_normal(100 + 10 * k).astype(np.float32) for k in range(9)]
+    beep = shot_settings("beep", 8, 2700, distance_m=3.0)
+    code = shot_settings("barker13", 8, 2700, chip_us=1000, distance_m=3.0)
+
+    archive = ShotArchive(str(tmp_path), 48000)
+    for k, wave in enumerate(waves):
+        assert archive.append(wave, 96.5, 17.0 + k, None, beep if k % 2 else code) == k
+    archive.close()
+
+    again = ShotArchive(str(tmp_path), mode="r")
+    assert len(again) == len(waves)
+    for k, wave in enumerate(waves):
+        assert np.array_equal(again.wave(k), wave)
+    # Same settings are only saved once
+    assert again.settings() == [code, beep]
+    assert again.settings(1) == beep
+    assert np.array_equal(again.index["echo_ms"], 17.0 + np.arange(len(waves)))
+    assert np.all(np.isnan(again.index["speed_m_per_s"]))
+    # Shorter shots are padded with zeros
+    both = again.waves([0, 8])
+    assert both.shape == (2, len(waves[8]))
+    assert np.array_equal(both[0, :len(waves[0])], waves[0]) and not both[0, len(waves[0]):].any()
+
+
+def test_adds_to_an_existing_archive(tmp_path):
+    archive = ShotArchive(str(tmp_path), 48000)
+    archive.append(np.ones(10), 1.0, 17.0, 343.0)
+    archive.close()
+    archive = ShotArchive(str(tmp_path), 48000)
+    assert archive.append(np.full(10, 2.0)) == 1
+    # Same length and next to each other: a view straight into the file
+    assert np.array_equal(archive.waves(), [[1.0] * 10, [2.0] * 10])
+    with pytest.raises(ValueError):
+        ShotArchive(str(tmp_path), 44100)
+    with pytest.raises(ValueError):
+        ShotArchive(str(tmp_path), mode="r").append(np.ones(10))
@@ -0,0 +1,35 @@
+#  Copyright 2026 Nolan Stokely <nolan@stokely.org>
+"""Checks for the sonar pipeline, with pretend capture and detect jobs."""
+import itertools
+import time
+
+from sonar import SonarPipeline
+
+
+def wait_for(condition, timeout_s=5.0):
+    deadline = time.monotonic() + timeout_s
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_keeps_only_the_newest_results():
+    counter = itertools.count()
+    sonar = SonarPipeline(lambda: (next(counter), None), lambda wave, beep_index: wave, keep_results=5).start()
+    try:
+        wait_for(lambda: sonar.n_results >= 50)
+    finally:
+        sonar.stop()
+    assert sonar.error is None
+    recent = sonar.recent(20)
+    assert len(recent) == 5
+    # Every shot is worked out, in order: none are thrown away
+    assert recent == list(range(sonar.n_results - 5, sonar.n_results))
+
+
+def test_capture_error_stops_it():
+    def capture():
+        raise RuntimeError("no microphone")
+    sonar = SonarPipeline(capture, lambda wave, beep_index: wave).start()
+    wait_for(lambda: not sonar.running)
+    assert isinstance(sonar.error, RuntimeError)
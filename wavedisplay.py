@@ -0,0 +1,155 @@
+#  Copyright 2026 Nolan Stokely <nolan@stokely.org>
+"""
+Drawing long recordings quickly.
+
+A screen can only show one column of pixels per x position, so drawing
+100,000 samples into a 600 pixel wide plot wastes most of the work. Instead
+we keep just the lowest and highest sample for each pixel column. The
+picture looks the same, but drawing it costs the same no matter how long the
+recording is.
+"""
+import numpy as np
+
+
+def minmax_envelope(x, y, n_columns):
+    """
+    Shrink (x, y) to at most 2 * n_columns points: the min and max of y in
+    each of n_columns equal chunks. x must be evenly spaced and increasing.
+    Short data is returned unchanged.
+    """
+    x = np.asarray(x)
+    y = np.asarray(y)
+    n = len(y)
+    n_columns = max(1, int(n_columns))
+    if n <= 2 * n_columns:
+        return x, y
+
+    per = int(np.ceil(n / n_columns))
+    full = n // per
+    chunks = y[:full * per].reshape(full, per)
+    lo = chunks.min(axis=1)
+    hi = chunks.max(axis=1)
+    xc = x[:full * per:per] + (x[1] - x[0]) * (per - 1) / 2.0
+    if full * per < n:
+        # Leftover samples make one last, shorter chunk
+        rest = y[full * per:]
+        lo = np.append(lo, rest.min())
+        hi = np.append(hi, rest.max())
+        xc = np.append(xc, x[full * per:].mean())
+
+    # Each chunk becomes a little vertical stroke: (x, min) then (x, max)
+    out_x = np.repeat(xc, 2)
+    out_y = np.empty(2 * len(lo), dtype=y.dtype)
+    out_y[0::2] = lo
+    out_y[1::2] = hi
+    return out_x, out_y
+
+
+class DecimatedLine:
+    """
+    Shows (x, y) on a matplotlib Line2D as a min/max envelope, one chunk per
+    pixel of the axes width. Zooming in (changing the x limits) picks the
+    visible part and works it out again, so detail comes back. Call update()
+    after the axes change size.
+    """
+
+    def __init__(self, ax, line):
+        self.ax = ax
+        self.line = line
+        self.x = np.zeros(0)
+        self.y = np.zeros(0)
+        self._shown_for = None
+        ax.callbacks.connect("xlim_changed", lambda ax: self.update())
+
+    def set_data(self, x, y):
+        self.x = np.asarray(x)
+        self.y = np.asarray(y)
+        self._shown_for = None
+        self.update()
+
+    def update(self):
+        x0, x1 = self.ax.get_xlim()
+        width = int(self.ax.bbox.width)
+        if self._shown_for == (x0, x1, width):
+            return
+        self._shown_for = (x0, x1, width)
+
+        # Only what's on screen, plus one sample past each edge
+        i0 = max(0, int(np.searchsorted(self.x, x0)) - 1)
+        i1 = min(len(self.x), int(np.searchsorted(self.x, x1)) + 1)
+        self.line.set_data(*minmax_envelope(self.x[i0:i1], self.y[i0:i1], width))
+
+
+class WavePlot:
+    """
+    The waveform picture in the GUI: one axes with the wave and a dashed
+    line at the echo, on any matplotlib canvas (Tk in the GUI, Agg for
+    benchmarks).
+
+    The wave and the echo marker are "animated": matplotlib leaves them
+    out of normal redraws and we paint just them on top of a saved
+    picture of everything else (blitting). Much faster than redrawing
+    the whole figure every shot.
+    """
+
+    def __init__(self, canvas):
+        self.canvas = canvas
+        self.ax = canvas.figure.add_subplot(111)
+        self.ax.set_title("Waveform")
+        self.ax.set_xlabel("Time (ms)")
+        self.ax.set_ylabel("Amplitude")
+
+        self.line, = self.ax.plot([], [], linewidth=1, animated=True)
+        self.marker = self.ax.axvline(0.0, linestyle="--", linewidth=1, animated=True, visible=False)
+        self.background = None
+
+        # Long recordings are shrunk to one min/max pair per pixel column
+        self.wave_view = DecimatedLine(self.ax, self.line)
+        canvas.mpl_connect("draw_event", self.on_draw)
+
+    def on_draw(self, event):
+        # Full redraw (first show, window resized, new axis limits):
+        # save the background, then put the moving parts back on top.
+        self.background = self.canvas.copy_from_bbox(self.canvas.figure.bbox)
+        self.wave_view.update()     # the plot may have changed size
+        self.ax.draw_artist(self.line)
+        self.ax.draw_artist(self.marker)
+
+    def show(self, x_ms, wave, echo_ms):
+        """Show a new wave with the echo marker at echo_ms."""
+        self.wave_view.set_data(x_ms, wave)
+
+        # Draw a vertical line where we think the echo peak is
+        self.marker.set_xdata([echo_ms, echo_ms])
+        self.marker.set_visible(bool(np.isfinite(echo_ms)))
+
+        # Only redraw everything if the axes have to change
+        full_redraw = self.background is None
+        if self.ax.get_title() == "Waveform":
+            self.ax.set_title("Waveform (click MEASURE to record again)")
+            full_redraw = True
+
+        # The beep lands a fraction of a sample differently each shot, so
+        # leave a little slack before deciding the x axis must move.
+        x0, x1 = self.ax.get_xlim()
+        if len(x_ms) > 1:
+            span = x_ms[-1] - x_ms[0]
+            if x_ms[0] < x0 or x_ms[-1] > x1 or (x1 - x0) > 1.2 * span:
+                slack = 0.1  # ms
+                self.ax.set_xlim(x_ms[0] - slack, x_ms[-1] + slack)
+                full_redraw = True
+
+        # Grow the y axis if the wave doesn't fit, shrink it if it's tiny
+        peak = float(np.max(np.abs(wave))) if len(wave) else 0.0
+        top = self.ax.get_ylim()[1]
+        if peak > 0 and (peak > top or peak < top / 4):
+            self.ax.set_ylim(-1.1 * peak, 1.1 * peak)
+            full_redraw = True
+
+        if full_redraw:
+            self.canvas.draw()      # on_draw() saves the new background
+        else:
+            self.canvas.restore_region(self.background)
+            self.ax.draw_artist(self.line)
+            self.ax.draw_artist(self.marker)
+            self.canvas.blit(self.ax.bbox)